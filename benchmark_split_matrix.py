@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for keymap_to_split_matrix.py
+
+Times each converter stage separately on keymap.json, layouts/*.json and
+synthetic keymaps that scale the layer count, keys per layer and DTSI size.
+
+    python3 benchmark_split_matrix.py run -o baseline.json
+    python3 benchmark_split_matrix.py run -o current.json
+    python3 benchmark_split_matrix.py compare baseline.json current.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import keymap_to_split_matrix as converter
+
+BENCHMARK_VERSION = 1
+
+# Stages in pipeline order; "convert" is the uncached convert_zmk_key pass over every layer
+STAGES = ('load', 'triggers', 'macros', 'action_mappings', 'convert', 'format')
+
+DEFAULT_SYNTHETIC_LAYERS = (28, 100, 250, 1000)
+DEFAULT_SYNTHETIC_KEYS = (80, 160, 320)
+DEFAULT_DTSI_SCALES = (1, 2, 4, 8)
+
+
+def reset_converter_state():
+    """Forget everything the converter memoizes in-process, as if it had just been started"""
+    converter.conversion_cache.clear()
+    converter._resolved_behavior_handlers.clear()
+    converter._character_tables.clear()
+    converter._dtsi_indexes.clear()
+    converter.dtsi_index_from_text.cache_clear()
+    converter.macro_mappings_from_text.cache_clear()
+
+
+def time_stage(function: Callable[[], Any], repeat: int) -> Tuple[Dict[str, float], Any]:
+    """Run a stage `repeat` times from a cold converter, progress muted; returns (timings in seconds, last result)"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        reset_converter_state()
+        with converter.progress_muted():
+            started = time.perf_counter()
+            result = function()
+            samples.append(time.perf_counter() - started)
+    return {'min': min(samples), 'median': statistics.median(samples)}, result
+
+
+def convert_layers(keymap: Dict[str, Any]) -> Tuple[List[List[Optional[str]]], int]:
+    """convert_zmk_key on every key of every layer, bypassing the conversion cache"""
+    layer_names = keymap.get('layer_names', [])
+    layers = []
+    errors = 0
+    for i, layer_data in enumerate(keymap.get('layers', [])):
+        layer_name = layer_names[i] if i < len(layer_names) else f"Layer_{i}"
+        labels = []
+        for key_data in layer_data:
+            try:
+                labels.append(converter.convert_zmk_key(key_data, layer_name)
+                              if isinstance(key_data, converter.Binding) else None)
+            except ValueError:
+                labels.append(None)
+                errors += 1
+        layers.append(labels)
+    return layers, errors
+
+
+def benchmark_keymap(keymap_path: str, dtsi_path: str = "keymap.dtsi", erb_path: str = "keymap.dtsi.erb",
+                     repeat: int = 5) -> Dict[str, Any]:
+    """Time every stage of one conversion; caches are reset so each repetition does the full work"""
+    stages = {}
+
+    stages['load'], keymap = time_stage(lambda: converter.load_keymap_fields(keymap_path), repeat)
+
+    stages['triggers'], zmk_triggers = time_stage(lambda: converter.parse_zmk_triggers(dtsi_path), repeat)
+
+    stages['macros'], zmk_macros = time_stage(lambda: converter.parse_zmk_macro_definitions(erb_path), repeat)
+
+    stages['convert'], (converted_layers, errors) = time_stage(lambda: convert_layers(keymap), repeat)
+
+    # Later stages need a full conversion, which fails on behaviors the converter doesn't know
+    action_mappings = {}
+    error = None
+    try:
+        with converter.progress_muted():
+            scan = converter.scan_keymap(keymap, cache=converter.ConversionCache())
+            user_layouts = converter.arrange_user_layouts(keymap, scan, zmk_triggers)
+    except ValueError as e:
+        error = str(e)
+    else:
+        stages['action_mappings'], action_mappings = time_stage(
+            lambda: converter.extract_action_mappings_from_keymap(keymap, scan, zmk_macros), repeat)
+        # Built from this case's own triggers and macros, so dtsiNx cases format their own config
+        config = converter.split_matrix_config(user_layouts, action_mappings)
+        stages['format'], _ = time_stage(lambda: converter.format_compact_json(config), repeat)
+
+    layer_count = len(converted_layers)
+    return {
+        'layers': layer_count,
+        'keys': sum(len(layer) for layer in converted_layers),
+        'dtsiBytes': os.path.getsize(dtsi_path),
+        'triggers': len(zmk_triggers),
+        'actionMappings': len(action_mappings),
+        'conversionErrors': errors,
+        'error': error,
+        'stages': {name: stages[name] for name in STAGES if name in stages},
+        'convertPerLayer': {stat: value / max(layer_count, 1) for stat, value in stages['convert'].items()},
+    }
+
+
+def binding_pool(keymap_path: str = "keymap.json") -> List[Dict[str, Any]]:
+    """Every binding of the real keymap (as JSON), so synthetic layers keep its mix of behaviors"""
+    keymap = converter.load_keymap_fields(keymap_path, ('layers',))
+    return [key.to_json() for layer in keymap['layers'] for key in layer if isinstance(key, converter.Binding)]
+
+
+def synthetic_keymap(layers: int, keys_per_layer: int, pool: List[Dict[str, Any]], seed: int = 80) -> Dict[str, Any]:
+    """A keymap of real bindings shuffled into `layers` layers of `keys_per_layer` keys"""
+    rng = random.Random(seed)
+    layer_names = list(converter.LAYER_NAMES[:layers])
+    layer_names += [f"Synthetic{i}" for i in range(len(layer_names), layers)]
+    return {
+        'layer_names': layer_names,
+        'layers': [[rng.choice(pool) for _ in range(keys_per_layer)] for _ in range(layers)],
+        'macros': [],
+        'holdTaps': [],
+        'combos': [],
+    }
+
+
+def synthetic_dtsi(content: str, scale: int, layer_names: List[str]) -> str:
+    """Repeat a DTSI `scale` times and add a layer access hold-tap + trigger macro per layer"""
+    generated = []
+    for number, layer_name in enumerate(layer_names):
+        macro = f"{layer_name.lower()}_with_lg_la_lc_ls_f{number}"
+        generated.append(f"""
+  {macro}: {macro} {{
+      compatible = "zmk,behavior-macro";
+      #binding-cells = <0>;
+      bindings = <&macro_tap &kp LG(LA(LC(LS(F{number})))) &macro_press &mo LAYER_{layer_name} &macro_pause_for_release &macro_release &mo LAYER_{layer_name}>;
+  }};
+  thumb_{layer_name.lower()}: thumb_{layer_name.lower()} {{
+      compatible = "zmk,behavior-hold-tap";
+      #binding-cells = <2>;
+      bindings = <&{macro}>, <&kp>;
+  }};""")
+    return '\n'.join([content] * scale) + '\n/ {\n  behaviors {' + ''.join(generated) + '\n  };\n};\n'
+
+
+def synthetic_cases(layer_counts, key_counts, dtsi_scales) -> List[Tuple[int, int, int]]:
+    """One sweep per dimension around the real keymap's size (28 layers, 80 keys, DTSI x1)"""
+    base_layers, base_keys, base_scale = 28, 80, 1
+    cases = [(layers, base_keys, base_scale) for layers in layer_counts]
+    cases += [(base_layers, keys, base_scale) for keys in key_counts]
+    cases += [(base_layers, base_keys, scale) for scale in dtsi_scales]
+    return list(dict.fromkeys(cases))
+
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    results = {}
+
+    def record(name: str, benchmark: Callable[[], Dict[str, Any]]):
+        print(f"⏱️  {name}...", end=' ', flush=True)
+        started = time.perf_counter()
+        results[name] = benchmark()
+        print(f"{time.perf_counter() - started:.2f}s")
+
+    if not args.no_real:
+        record('keymap.json', lambda: benchmark_keymap('keymap.json', repeat=args.repeat))
+        for path in sorted(glob.glob('layouts/*.json')):
+            record(path, lambda path=path: benchmark_keymap(path, repeat=args.repeat))
+
+    if not args.no_synthetic:
+        pool = binding_pool()
+        with open('keymap.dtsi', 'r', encoding='utf-8') as f:
+            dtsi_content = f.read()
+        with open('keymap.dtsi.erb', 'r', encoding='utf-8') as f:
+            erb_content = f.read()
+
+        with tempfile.TemporaryDirectory(prefix='split-matrix-bench-') as workdir:
+            for layers, keys, scale in synthetic_cases(args.layers, args.keys, args.dtsi_scales):
+                keymap = synthetic_keymap(layers, keys, pool)
+                keymap_path = os.path.join(workdir, f'keymap-{layers}x{keys}.json')
+                with open(keymap_path, 'w', encoding='utf-8') as f:
+                    json.dump(keymap, f)
+                dtsi_path = os.path.join(workdir, f'keymap-{layers}x{scale}.dtsi')
+                with open(dtsi_path, 'w', encoding='utf-8') as f:
+                    f.write(synthetic_dtsi(dtsi_content, scale, keymap['layer_names']))
+                erb_path = os.path.join(workdir, f'keymap-x{scale}.dtsi.erb')
+                with open(erb_path, 'w', encoding='utf-8') as f:
+                    f.write('\n'.join([erb_content] * scale))
+
+                record(f'synthetic/{layers}layers-{keys}keys-dtsi{scale}x',
+                       lambda: benchmark_keymap(keymap_path, dtsi_path, erb_path, repeat=args.repeat))
+
+    return {
+        'version': BENCHMARK_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+
+
+def print_results(report: Dict[str, Any]):
+    print(f"\n{'Case':<44}" + ''.join(f"{stage:>16}" for stage in STAGES))
+    for name, result in report['results'].items():
+        row = ''.join(f"{result['stages'][stage]['median'] * 1000:>14.2f}ms" if stage in result['stages']
+                      else f"{'—':>16}" for stage in STAGES)
+        print(f"{name:<44}{row}")
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any],
+                    threshold: float, noise_floor: float) -> List[Tuple[str, str, float, float]]:
+    """(case, stage, baseline, current) medians that got slower by more than threshold and noise_floor seconds"""
+    regressions = []
+    print(f"\n{'Case':<44} {'Stage':<16} {'Baseline':>11} {'Current':>11} {'Change':>8}")
+    for name, result in current['results'].items():
+        baseline_result = baseline['results'].get(name)
+        if baseline_result is None:
+            continue
+        for stage, timing in result['stages'].items():
+            if stage not in baseline_result['stages']:
+                continue
+            before = baseline_result['stages'][stage]['median']
+            after = timing['median']
+            change = (after - before) / before if before else 0.0
+            regressed = change > threshold and after - before > noise_floor
+            flag = '  ❌ regression' if regressed else ('  ✅' if change < -threshold else '')
+            print(f"{name:<44} {stage:<16} {before * 1000:>9.2f}ms {after * 1000:>9.2f}ms {change:>+7.0%}{flag}")
+            if regressed:
+                regressions.append((name, stage, before, after))
+
+    missing = sorted(set(baseline['results']) - set(current['results']))
+    if missing:
+        print(f"\n⚠️  Not in current run: {', '.join(missing)}")
+    return regressions
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the stages of keymap_to_split_matrix.py")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="benchmark and save the results as a JSON baseline")
+    run.add_argument('-o', '--output', default='benchmark_results.json',
+                     help="where to save the results (default: benchmark_results.json)")
+    run.add_argument('-r', '--repeat', type=int, default=5,
+                     help="repetitions per stage; medians are compared (default: 5)")
+    run.add_argument('--layers', type=parse_int_list, default=list(DEFAULT_SYNTHETIC_LAYERS),
+                     help="synthetic layer counts (default: 28,100,250,1000)")
+    run.add_argument('--keys', type=parse_int_list, default=list(DEFAULT_SYNTHETIC_KEYS),
+                     help="synthetic keys per layer (default: 80,160,320)")
+    run.add_argument('--dtsi-scales', type=parse_int_list, default=list(DEFAULT_DTSI_SCALES),
+                     help="synthetic DTSI size multipliers (default: 1,2,4,8)")
+    run.add_argument('--no-real', action='store_true', help="skip keymap.json and layouts/*.json")
+    run.add_argument('--no-synthetic', action='store_true', help="skip the synthetic keymaps")
+
+    compare = commands.add_parser('compare', help="flag stages that got slower than a baseline")
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('-t', '--threshold', type=float, default=0.10,
+                         help="relative slowdown that counts as a regression (default: 0.10)")
+    compare.add_argument('--noise-floor', type=float, default=0.5,
+                         help="ignore slowdowns smaller than this many milliseconds (default: 0.5)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+
+    if args.command == 'run':
+        report = run_benchmarks(args)
+        print_results(report)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Saved results to {args.output}")
+        return
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    regressions = compare_reports(baseline, current, args.threshold, args.noise_floor / 1000)
+    if regressions:
+        print(f"\n❌ {len(regressions)} stage(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+    print("\n✅ No regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,41 +9,352 @@
 Glove80 Keymap to Split Matrix Layout Converter
 Converts keymap.json to @split-matrix-layouts.md format for OverKeys
 Fixed the terrible key mapping issues!
+
+Startup: PyYAML, tracemalloc, hashlib, argparse and the process pool are
+imported only when needed (a library import pays for none of them), regexes
+compile on first use, and emoji.yaml/world.yaml are read from the JSON
+snapshots `rake snapshots` builds. Run it as
+`python3 -m keymap_to_split_matrix` to reuse the cached bytecode instead of
+recompiling this file on every start.
+
+Library use: convert_keymap(keymap_dict, dtsi=..., dtsi_erb=..., emoji=...,
+world=...) returns the config without touching the disk or stdout. For
+tools in other languages, --serve answers the same conversions over a Unix
+socket (see ConversionServer). Keymap layers are lowered to immutable,
+shared Binding tuples as they load; convert_zmk_key() takes one of those,
+and lower_binding() makes one from a JSON {"value", "params"} dict.
 """
 
+import contextlib
+import contextvars
+import functools
+import io
 import json
+import os
 import sys
 import re
-from typing import Dict, List, Any, Optional
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Any, NamedTuple, Optional, TextIO, Tuple
+
+if TYPE_CHECKING:
+    import argparse
+
+
+class Profiler:
+    """--profile: wall/CPU time and tracemalloc peak per stage, call counts per behavior kind"""
+
+    def __init__(self):
+        self.stages = []  # In start order; nested stages (layers) follow their parent
+        self.behaviors = {}  # Function → behavior kind → {"count", "seconds"}
+        self._open = []  # Memory of the stages still running: {"start", "peak"}
+        self._started = time.perf_counter()
+        import tracemalloc
+        self._tracemalloc = tracemalloc
+        tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        # Fold the peak so far into the enclosing stages before resetting it for this one
+        current, peak = self._tracemalloc.get_traced_memory()
+        for frame in self._open:
+            frame['peak'] = max(frame['peak'], peak)
+        self._tracemalloc.reset_peak()
+
+        record = {'name': name}
+        self.stages.append(record)
+        frame = {'start': current, 'peak': current}
+        self._open.append(frame)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            record['wallSeconds'] = time.perf_counter() - wall
+            record['cpuSeconds'] = time.process_time() - cpu
+            frame['peak'] = max(frame['peak'], self._tracemalloc.get_traced_memory()[1])
+            self._open.pop()
+            for outer in self._open:
+                outer['peak'] = max(outer['peak'], frame['peak'])
+            record['peakBytes'] = frame['peak'] - frame['start']
+
+    def count(self, function: str, kind: str, seconds: float):
+        counter = self.behaviors.setdefault(function, {}).setdefault(kind, {'count': 0, 'seconds': 0.0})
+        counter['count'] += 1
+        counter['seconds'] += seconds
+
+    def close(self):
+        """Stop tracing allocations; the collected counters stay readable"""
+        self._tracemalloc.stop()
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'wallSeconds': time.perf_counter() - self._started,
+            'peakBytes': max((stage.get('peakBytes', 0) for stage in self.stages), default=0),
+            'stages': self.stages,
+            'behaviors': {function: dict(sorted(kinds.items(), key=lambda item: -item[1]['seconds']))
+                          for function, kinds in self.behaviors.items()},
+        }
+
+
+# Set by profiling(); None keeps profile_stage() down to one check
+profiler: Optional[Profiler] = None
+# Module functions whose calls --profile counts → kind(*args) grouping their calls
+_profiled_functions: Dict[str, Callable[..., str]] = {}
+
+
+def profile_stage(name: str):
+    """Context manager timing a pipeline stage when profiling, a no-op otherwise"""
+    return profiler.stage(name) if profiler else contextlib.nullcontext()
+
+
+def profiled_calls(function_name: str, kind: Callable[..., str]):
+    """Have profiling() count calls and total time of the decorated function per kind(*args).
+
+    The function itself is left as is: key conversion pays nothing unless a profile runs.
+    """
+    def register(function):
+        _profiled_functions[function_name] = kind
+        return function
+    return register
+
+
+def _counted(function_name: str, function: Callable, kind: Callable[..., str]) -> Callable:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.count(function_name, kind(*args, **kwargs), time.perf_counter() - started)
+    return wrapper
+
+
+@contextlib.contextmanager
+def profiling():
+    """Profile the block: a Profiler for profile_stage(), and counting wrappers swapped in for
+    the profiled_calls() functions (module-level callers look them up by name), removed after"""
+    global profiler
+    module = sys.modules[__name__]
+    originals = {name: getattr(module, name) for name in _profiled_functions}
+    profiler = Profiler()
+    for name, kind in _profiled_functions.items():
+        setattr(module, name, _counted(name, originals[name], kind))
+    try:
+        yield profiler
+    finally:
+        for name, function in originals.items():
+            setattr(module, name, function)
+        profiler.close()
+        profiler = None
+
+
+class LazyPattern:
+    """re.compile on first use, so runs that never reach a parser don't pay to compile its patterns"""
+
+    def __init__(self, pattern, flags: int = 0):
+        self._pattern = pattern
+        self._flags = flags
+
+    def __getattr__(self, name: str):
+        # Only called until the compiled pattern's methods are cached on the instance
+        compiled = self.__dict__.get('_compiled')
+        if compiled is None:
+            compiled = self._compiled = re.compile(self._pattern, self._flags)
+        value = getattr(compiled, name)
+        setattr(self, name, value)
+        return value
+
+
+# Progress output of the conversion stages; convert_keymap() switches it off for its own calls
+_progress_enabled = contextvars.ContextVar('progress_enabled', default=True)
+
+
+def progress(*args, **kwargs):
+    """print() for everything the conversion stages report, so --quiet and library calls can mute it"""
+    if _progress_enabled.get():
+        print(*args, **kwargs)
+
+
+@contextlib.contextmanager
+def progress_muted():
+    """Silence progress() in this context (thread or task) only; sys.stdout is left alone"""
+    token = _progress_enabled.set(False)
+    try:
+        yield
+    finally:
+        _progress_enabled.reset(token)
+
+
+class ConversionError(Exception):
+    """Base of the errors a conversion raises"""
+
+
+class KeymapFormatError(ConversionError, ValueError):
+    """The keymap isn't shaped like a Glove80 Layout Editor export"""
+
+
+class UnknownBehaviorError(ConversionError, ValueError):
+    """A binding uses a behavior (or character) the converter has no label for"""
+
+
+class SourceError(ConversionError):
+    """A DTSI, ERB or character data source is missing or can't be parsed"""
+
+
+class OptionError(ConversionError, ValueError):
+    """A conversion option, like operating_system, has an unsupported value"""
+
+
+class Binding(NamedTuple):
+    """One node of a lowered key binding: a behavior or keycode value and its params.
+
+    lower_binding() builds these once from keymap.json's {"value", "params"}
+    dicts, with interned names and one shared instance per distinct subtree.
+    Being tuples, equal bindings also hash alike, so they key caches as is.
+    """
+    value: Any
+    params: Tuple[Any, ...] = ()
+
+    def to_json(self) -> Dict[str, Any]:
+        """The {"value", "params"} dict this binding was lowered from"""
+        return {'value': self.value,
+                'params': [param.to_json() if isinstance(param, Binding) else param for param in self.params]}
+
+
+def _lower_binding_node(node: Dict[str, Any], interned: Dict[Binding, Binding]) -> Binding:
+    """The shared Binding of a {"value", "params"} dict whose params may not be lowered yet"""
+    value = node.get('value', '')
+    if isinstance(value, str):
+        value = sys.intern(value)
+    binding = Binding(value, tuple(lower_binding(param, interned) for param in node.get('params') or ()))
+    return interned.setdefault(binding, binding)
+
+
+def lower_binding(node, interned: Optional[Dict[Binding, Binding]] = None) -> Any:
+    """Binding for a {"value", "params"} dict; lists become tuples, anything else stays as is
+
+    Equal subtrees become one object within the interned table, which is
+    per load: a fresh one when not given, so --serve and --watch don't keep
+    every binding they have ever seen.
+    """
+    if interned is None:
+        interned = {}
+    if isinstance(node, dict):
+        return _lower_binding_node(node, interned)
+    elif isinstance(node, list):
+        return tuple(lower_binding(item, interned) for item in node)
+    return node
+
+
+def lower_layers(layers, interned: Optional[Dict[Binding, Binding]] = None) -> Any:
+    """keymap.json layers as tuples of shared Bindings (already lowered layers are kept)"""
+    if not isinstance(layers, (list, tuple)):
+        return layers
+    if interned is None:
+        interned = {}
+    return tuple(tuple(lower_binding(key, interned) for key in layer) if isinstance(layer, list) else layer
+                 for layer in layers)
+
 
 # Glove80 physical layout mapping based on keymap.dtsi
 GLOVE80_LAYOUT = {
-    'left_main_rows': [
-        [0, 1, 2, 3, 4],  # Row 0: F1-F5
-        [10, 11, 12, 13, 14, 15],  # Row 1: Numbers + extra
-        [22, 23, 24, 25, 26, 27],  # Row 2: Top alpha row + extra
-        [34, 35, 36, 37, 38, 39],  # Row 3: Home row + extra
-        [46, 47, 48, 49, 50, 51],  # Row 4: Bottom alpha + extra
-        [64, 65, 66, 67, 68],  # Row 5: Bottom row (5 keys)
-    ],
-    'right_main_rows': [
-        [5, 6, 7, 8, 9],  # Row 0: F6-F10
-        [16, 17, 18, 19, 20, 21],  # Row 1: Numbers + extra
-        [28, 29, 30, 31, 32, 33],  # Row 2: Top alpha row + extra
-        [40, 41, 42, 43, 44, 45],  # Row 3: Home row + extra
-        [58, 59, 60, 61, 62, 63],  # Row 4: Bottom alpha + extra
-        [75, 76, 77, 78, 79],  # Row 5: Bottom row (5 keys)
-    ],
-    'left_thumb_rows': [
-        [52, 53, 54],  # Thumb row 0: 3 keys (top row - more accessible)
-        [69, 70, 71],  # Thumb row 1: 3 keys (bottom row - less accessible)
-    ],
-    'right_thumb_rows': [
-        [55, 56, 57],  # Thumb row 0: 3 keys (top row) - flipped order
-        [72, 73, 74],  # Thumb row 1: 3 keys (bottom row) - flipped order
-    ]
+    # Key positions in OverKeys' own row structure; None pads the 5-key rows
+    # so every main row has 6 cells aligned to the inner column
+    'leftHand': {
+        'mainRows': [
+            [0, 1, 2, 3, 4, None],  # Row 0: F1-F5
+            [10, 11, 12, 13, 14, 15],  # Row 1: Numbers + extra
+            [22, 23, 24, 25, 26, 27],  # Row 2: Top alpha row + extra
+            [34, 35, 36, 37, 38, 39],  # Row 3: Home row + extra
+            [46, 47, 48, 49, 50, 51],  # Row 4: Bottom alpha + extra
+            [64, 65, 66, 67, 68, None],  # Row 5: Bottom row (5 keys)
+        ],
+        'thumbRows': [
+            [52, 53, 54],  # Thumb row 0: 3 keys (top row - more accessible)
+            [69, 70, 71],  # Thumb row 1: 3 keys (bottom row - less accessible)
+        ],
+    },
+    'rightHand': {
+        'mainRows': [
+            [None, 5, 6, 7, 8, 9],  # Row 0: F6-F10
+            [16, 17, 18, 19, 20, 21],  # Row 1: Numbers + extra
+            [28, 29, 30, 31, 32, 33],  # Row 2: Top alpha row + extra
+            [40, 41, 42, 43, 44, 45],  # Row 3: Home row + extra
+            [58, 59, 60, 61, 62, 63],  # Row 4: Bottom alpha + extra
+            [None, 75, 76, 77, 78, 79],  # Row 5: Bottom row (5 keys)
+        ],
+        'thumbRows': [
+            [55, 56, 57],  # Thumb row 0: 3 keys (top row) - flipped order
+            [72, 73, 74],  # Thumb row 1: 3 keys (bottom row) - flipped order
+        ],
+    },
+    'homeRow': {
+        'rowIndex': 4,
+        'leftPosition': 2,
+        'rightPosition': 2
+    },
 }
 
+LAYOUT_HANDS = ('leftHand', 'rightHand')
+LAYOUT_SECTIONS = ('mainRows', 'thumbRows')
+
+
+class PhysicalLayout:
+    """Where each key position of a board is drawn, precomputed for one gather pass per layer.
+
+    The layout data has GLOVE80_LAYOUT's shape: per hand and section, rows of
+    key positions (None for a padding cell), plus the OverKeys homeRow marker.
+    """
+
+    def __init__(self, layout: Dict[str, Any]):
+        self.home_row = dict(layout.get('homeRow', GLOVE80_LAYOUT['homeRow']))
+        self.positions = {}  # Key position → (hand, section, row, column)
+        self.rows = []  # (hand, section, start, end) slices of the gathered cells, in output order
+        cells = []
+        for hand in LAYOUT_HANDS:
+            for section in LAYOUT_SECTIONS:
+                try:
+                    rows = layout[hand][section]
+                except (KeyError, TypeError):
+                    raise ValueError(f"Layout has no {hand}.{section}") from None
+                for row_index, row in enumerate(rows):
+                    self.rows.append((hand, section, len(cells), len(cells) + len(row)))
+                    for column, pos in enumerate(row):
+                        if pos is None:
+                            cells.append(None)
+                            continue
+                        if not isinstance(pos, int) or pos < 0:
+                            raise ValueError(f"Layout {hand}.{section}[{row_index}][{column}]: bad key position {pos!r}")
+                        if pos in self.positions:
+                            raise ValueError(f"Layout places key position {pos} twice")
+                        self.positions[pos] = (hand, section, row_index, column)
+                        cells.append(pos)
+
+        # Padding cells and positions past a short layer all read the same trailing None
+        self.size = max(self.positions, default=-1) + 1
+        self.gather = [self.size if pos is None else pos for pos in cells]
+
+    def build_rows(self, labels: List[Any]) -> Dict[str, Dict[str, List[List[Any]]]]:
+        """Arrange one layer's key labels into leftHand/rightHand main and thumb rows"""
+        padded = list(labels[:self.size])
+        padded.extend([None] * (self.size + 1 - len(padded)))
+        cells = [padded[pos] for pos in self.gather]
+
+        hands = {hand: {section: [] for section in LAYOUT_SECTIONS} for hand in LAYOUT_HANDS}
+        for hand, section, start, end in self.rows:
+            row = cells[start:end]
+            # Replace all-null rows with empty arrays
+            hands[hand][section].append(row if any(key is not None for key in row) else [])
+        return hands
+
+
+def load_physical_layout(filepath: str) -> PhysicalLayout:
+    """A PhysicalLayout from a JSON file shaped like GLOVE80_LAYOUT"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return PhysicalLayout(json.load(f))
+
+
+DEFAULT_PHYSICAL_LAYOUT = PhysicalLayout(GLOVE80_LAYOUT)
+
 # ZMK to readable key mapping - NO MORE GARBAGE KEYS!
 ZMK_KEY_MAPPING = {
     # Basic keys
@@ -65,7 +376,7 @@ ZMK_KEY_MAPPING = {
     # Symbols
     'MINUS': '-', 'EQUAL': '=', 'LBKT': '[', 'RBKT': ']', 'BSLH': '\\',
     'SEMI': ';', 'SQT': "'", 'GRAVE': '`', 'COMMA': ',', 'DOT': '.',
-    'FSLH': '/', 'EXCL': '!', 'AT': '@', 'HASH': '#', 'DLLR': '$',
+    'FSLH': '/', 'SLASH': '/', 'EXCL': '!', 'AT': '@', 'HASH': '#', 'DLLR': '$',
     'PRCNT': '%', 'CARET': '^', 'AMPS': '&', 'ASTRK': '*', 'LPAR': '(',
     'RPAR': ')', 'UNDER': '_', 'PLUS': '+', 'LBRC': '{', 'RBRC': '}',
     'PIPE': '|', 'COLON': ':', 'DQT': '"', 'TILDE': '~', 'LT': '<',
@@ -167,693 +478,944 @@ def add_spaces_to_long_words(text: str) -> str:
     return replacements.get(text, text)
 
 
-def convert_zmk_key(key_data: Dict[str, Any], layer_name: str = '') -> str:
-    """Convert ZMK key data to readable string - MUCH BETTER!"""
-    value = key_data.get('value', '')
-    params = key_data.get('params', [])
-
-    if value == '&trans':
-        return None  # Transparent key
-    elif value == '&none':
-        return None  # No key
-    elif value == '&kp':
-        # Standard keypress
-        if params and isinstance(params[0], dict):
-            key_code = params[0].get('value', '')
-
-            # Handle simple shift combinations FIRST (LS(G) -> G or LS(TAB) -> ⇧Tab)
-            if key_code == 'LS' and params[0].get('params'):
-                inner_key = params[0]['params'][0].get('value', '')
-                # For letters, LS(G) should render as just G since it's a capital letter
-                if inner_key in ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'Q',
-                                 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z']:
-                    return inner_key  # Capital letters (shifted) - just show the letter
-                elif inner_key == 'TAB':
-                    return '⇧⇥'  # Use compact symbols
-                else:
-                    return f'⇧{ZMK_KEY_MAPPING.get(inner_key, inner_key)}'
-
-            # Handle nested mod combinations like LG(LA(F16)) -> CMD+ALT+F16 (but skip simple LS cases)
-            elif key_code in ['LG', 'LA', 'LC'] and params[0].get('params'):
-                # Build modifier chain
-                mod_chain = []
-                current_param = params[0]
-
-                while current_param and isinstance(current_param, dict):
-                    mod_key = current_param.get('value', '')
-                    if mod_key == 'LG':
-                        mod_chain.append('⌘')
-                    elif mod_key == 'LA':
-                        mod_chain.append('⌥')
-                    elif mod_key == 'LC':
-                        mod_chain.append('⌃')
-                    elif mod_key == 'LS':
-                        mod_chain.append('⇧')
-                    elif mod_key in ZMK_KEY_MAPPING:
-                        # Final key reached
-                        if mod_chain:
-                            return ''.join(mod_chain) + ZMK_KEY_MAPPING.get(mod_key, mod_key)
-                        else:
-                            return ZMK_KEY_MAPPING.get(mod_key, mod_key)
-                    else:
-                        # Final key reached
-                        if mod_chain:
-                            return ''.join(mod_chain) + mod_key
-                        else:
-                            return mod_key
-
-                    # Move to next nested parameter
-                    if current_param.get('params') and len(current_param['params']) > 0:
-                        current_param = current_param['params'][0]
-                    else:
-                        break
-
-                return ''.join(mod_chain) if mod_chain else 'MOD'
-            elif key_code == 'RS' and params[0].get('params'):
-                inner_key = params[0]['params'][0].get('value', '')
-                return ZMK_KEY_MAPPING.get(inner_key, inner_key)
-            # Handle string-based combinations
-            elif key_code.startswith('LS(') and key_code.endswith(')'):
-                inner_key = key_code[3:-1]
-                if inner_key == 'TAB':
-                    return '⇧⇥'  # Use compact symbols
-                elif inner_key in ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'Q',
-                                   'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z']:
-                    return inner_key  # Capital letters (shifted) - just show the letter
-                return ZMK_KEY_MAPPING.get(inner_key, inner_key)
-            elif key_code.startswith('RS(') and key_code.endswith(')'):
-                inner_key = key_code[3:-1]
-                return ZMK_KEY_MAPPING.get(inner_key, inner_key)
-
-            result = ZMK_KEY_MAPPING.get(key_code, key_code)
-            return add_spaces_to_long_words(result)
-        raise ValueError(f"Unknown keypress behavior: {key_data}")
-    elif value == '&to':
-        # Layer switch - show layer number/name
-        if params and isinstance(params[0], dict):
-            layer_num = params[0].get('value', '')
-            return f'Layer {layer_num}'
-        return 'Layer'
-    elif value == '&mt':
-        # Mod-tap - show the tap action (the key you actually see)
-        if len(params) >= 2 and isinstance(params[1], dict):
-            key_code = params[1].get('value', '')
-            return ZMK_KEY_MAPPING.get(key_code, key_code)
-        raise ValueError(f"Invalid mod-tap behavior: {key_data}")
-    elif value == '&msc':
-        # Mouse scroll - extract the direction from params
-        if params and isinstance(params[0], dict):
-            scroll_type = params[0].get('value', '')
-            if scroll_type == 'SCRL_UP':
-                return 'Scroll↑'
-            elif scroll_type == 'SCRL_DOWN':
-                return 'Scroll↓'
-            elif scroll_type == 'SCRL_LEFT':
-                return 'Scroll←'
-            elif scroll_type == 'SCRL_RIGHT':
-                return 'Scroll→'
-        return 'Scroll'
-    elif value == '&mmv':
-        # Mouse movement - extract the direction from params (no "Move" prefix needed!)
-        if params and isinstance(params[0], dict):
-            move_type = params[0].get('value', '')
-            if move_type == 'MOVE_UP':
-                return '↑'
-            elif move_type == 'MOVE_DOWN':
-                return '↓'
-            elif move_type == 'MOVE_LEFT':
-                return '←'
-            elif move_type == 'MOVE_RIGHT':
-                return '→'
-        return 'Move'
-    elif value == '&mkp':
-        # Mouse click - extract the button from params
-        if params and isinstance(params[0], dict):
-            click_type = params[0].get('value', '')
-            if click_type == 'LCLK':
-                return 'L Click'
-            elif click_type == 'RCLK':
-                return 'R Click'
-            elif click_type == 'MCLK':
-                return 'M Click'
-            elif click_type == 'MB4':
-                return 'Btn4'
-            elif click_type == 'MB5':
-                return 'Btn5'
-        return 'Click'
-    elif value == '&rgb_ug':
-        # RGB underglow controls - extract the command from params
-        if params and isinstance(params[0], dict):
-            rgb_cmd = params[0].get('value', '')
-            if rgb_cmd == 'RGB_TOG':
-                return 'RGBToggle'
-            elif rgb_cmd == 'RGB_HUI':
-                return 'Hue+'
-            elif rgb_cmd == 'RGB_HUD':
-                return 'Hue-'
-            elif rgb_cmd == 'RGB_SAI':
-                return 'Sat+'
-            elif rgb_cmd == 'RGB_SAD':
-                return 'Sat-'
-            elif rgb_cmd == 'RGB_BRI':
-                return 'Bright+'
-            elif rgb_cmd == 'RGB_BRD':
-                return 'Bright-'
-            elif rgb_cmd == 'RGB_SPI':
-                return 'Speed+'
-            elif rgb_cmd == 'RGB_SPD':
-                return 'Speed-'
-            elif rgb_cmd == 'RGB_EFF':
-                return 'Effect+'
-            elif rgb_cmd == 'RGB_EFR':
-                return 'Effect-'
-        return 'RGB'
-    elif value == 'Custom':
-        # Custom behavior - extract from params
-        if params and isinstance(params[0], dict):
-            custom_behavior = params[0].get('value', '')
-            result = parse_custom_behavior_properly(custom_behavior, layer_name)
-            return add_spaces_to_long_words(result)
-        raise ValueError(f"Unknown custom behavior: {key_data}")
+SHIFTED_LETTERS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+# Modifier functions that wrap a key code, e.g. LG(LA(F16)) -> ⌘⌥F16
+MODIFIER_SYMBOLS = {'LG': '⌘', 'LA': '⌥', 'LC': '⌃', 'LS': '⇧'}
+
+# Parameter → label tables for simple parameterized behaviors
+MOUSE_SCROLL_LABELS = {
+    'SCRL_UP': 'Scroll↑', 'SCRL_DOWN': 'Scroll↓',
+    'SCRL_LEFT': 'Scroll←', 'SCRL_RIGHT': 'Scroll→',
+}
+MOUSE_MOVE_LABELS = {
+    'MOVE_UP': '↑', 'MOVE_DOWN': '↓', 'MOVE_LEFT': '←', 'MOVE_RIGHT': '→',
+}
+MOUSE_CLICK_LABELS = {
+    'LCLK': 'L Click', 'RCLK': 'R Click', 'MCLK': 'M Click', 'MB4': 'Btn4', 'MB5': 'Btn5',
+}
+RGB_COMMAND_LABELS = {
+    'RGB_TOG': 'RGBToggle', 'RGB_HUI': 'Hue+', 'RGB_HUD': 'Hue-',
+    'RGB_SAI': 'Sat+', 'RGB_SAD': 'Sat-', 'RGB_BRI': 'Bright+', 'RGB_BRD': 'Bright-',
+    'RGB_SPI': 'Speed+', 'RGB_SPD': 'Speed-', 'RGB_EFF': 'Effect+', 'RGB_EFR': 'Effect-',
+}
+
+
+def is_overlay_layer(layer_name: str) -> bool:
+    """Home row mods show modifier symbols on overlay layers, tap keys on the base layer"""
+    return layer_name not in ['', 'GRAPHITE']
+
+
+def _convert_shifted_key(param: Binding) -> str:
+    """LS(G) -> G (capital letter) or LS(TAB) -> ⇧⇥"""
+    inner_key = param.params[0].value
+    if inner_key in SHIFTED_LETTERS:
+        return inner_key  # Capital letters (shifted) - just show the letter
+    elif inner_key == 'TAB':
+        return '⇧⇥'  # Use compact symbols
+    return f'⇧{ZMK_KEY_MAPPING.get(inner_key, inner_key)}'
+
+
+def _convert_modifier_chain(param: Binding) -> str:
+    """LG(LA(F16)) -> ⌘⌥F16"""
+    mod_chain = []
+    current_param = param
+
+    while isinstance(current_param, Binding):
+        mod_key = current_param.value
+        symbol = MODIFIER_SYMBOLS.get(mod_key)
+        if symbol is None:
+            # Final key reached
+            return ''.join(mod_chain) + ZMK_KEY_MAPPING.get(mod_key, mod_key)
+        mod_chain.append(symbol)
+
+        # Move to next nested parameter
+        if current_param.params:
+            current_param = current_param.params[0]
+        else:
+            break
+
+    return ''.join(mod_chain) if mod_chain else 'MOD'
+
+
+def _convert_right_shifted_key(param: Binding) -> str:
+    """RS(X) -> X"""
+    inner_key = param.params[0].value
+    return ZMK_KEY_MAPPING.get(inner_key, inner_key)
+
+
+# Nested modifier functions inside &kp, keyed by the outer function name
+KEYPRESS_MODIFIER_HANDLERS = {
+    'LS': _convert_shifted_key,
+    'LG': _convert_modifier_chain,
+    'LA': _convert_modifier_chain,
+    'LC': _convert_modifier_chain,
+    'RS': _convert_right_shifted_key,
+}
+
+
+def _convert_keypress(key_data: Binding, params: Tuple[Any, ...], layer_name: str) -> str:
+    """Standard keypress"""
+    if not params or not isinstance(params[0], Binding):
+        raise UnknownBehaviorError(f"Unknown keypress behavior: {key_data.to_json()}")
+
+    key_code = params[0].value
+    if params[0].params:
+        modifier_handler = KEYPRESS_MODIFIER_HANDLERS.get(key_code)
+        if modifier_handler:
+            return modifier_handler(params[0])
+
+    # Handle string-based combinations
+    if key_code.endswith(')'):
+        if key_code.startswith('LS('):
+            inner_key = key_code[3:-1]
+            if inner_key == 'TAB':
+                return '⇧⇥'  # Use compact symbols
+            elif inner_key in SHIFTED_LETTERS:
+                return inner_key  # Capital letters (shifted) - just show the letter
+            return ZMK_KEY_MAPPING.get(inner_key, inner_key)
+        elif key_code.startswith('RS('):
+            inner_key = key_code[3:-1]
+            return ZMK_KEY_MAPPING.get(inner_key, inner_key)
+
+    result = ZMK_KEY_MAPPING.get(key_code, key_code)
+    return add_spaces_to_long_words(result)
+
+
+def _convert_layer_switch(key_data: Binding, params: Tuple[Any, ...], layer_name: str) -> str:
+    """Layer switch - show layer number/name"""
+    if params and isinstance(params[0], Binding):
+        return f"Layer {params[0].value}"
+    return 'Layer'
+
+
+def _convert_mod_tap(key_data: Binding, params: Tuple[Any, ...], layer_name: str) -> str:
+    """Mod-tap - show the tap action (the key you actually see)"""
+    if len(params) >= 2 and isinstance(params[1], Binding):
+        key_code = params[1].value
+        return ZMK_KEY_MAPPING.get(key_code, key_code)
+    raise UnknownBehaviorError(f"Invalid mod-tap behavior: {key_data.to_json()}")
+
+
+def _param_label_converter(labels: Dict[str, str], default: str):
+    """Build a converter that looks up the first param in a label table"""
+    def convert(key_data: Binding, params: Tuple[Any, ...], layer_name: str) -> str:
+        if params and isinstance(params[0], Binding):
+            return labels.get(params[0].value, default)
+        return default
+    return convert
+
+
+def _convert_custom(key_data: Binding, params: Tuple[Any, ...], layer_name: str) -> str:
+    """Custom behavior - extract from params"""
+    if params and isinstance(params[0], Binding):
+        result = parse_custom_behavior_properly(params[0].value, layer_name)
+        return add_spaces_to_long_words(result)
+    raise UnknownBehaviorError(f"Unknown custom behavior: {key_data.to_json()}")
+
+
+def _convert_empty(key_data: Binding, params: Tuple[Any, ...], layer_name: str) -> Optional[str]:
+    """Transparent and no-op keys render as null"""
+    return None
+
+
+# convert_zmk_key dispatch table, keyed by the binding's behavior value
+KEY_VALUE_HANDLERS = {
+    '&trans': _convert_empty,
+    '&none': _convert_empty,
+    '&kp': _convert_keypress,
+    '&to': _convert_layer_switch,
+    '&mt': _convert_mod_tap,
+    '&msc': _param_label_converter(MOUSE_SCROLL_LABELS, 'Scroll'),
+    '&mmv': _param_label_converter(MOUSE_MOVE_LABELS, 'Move'),
+    '&mkp': _param_label_converter(MOUSE_CLICK_LABELS, 'Click'),
+    '&rgb_ug': _param_label_converter(RGB_COMMAND_LABELS, 'RGB'),
+    'Custom': _convert_custom,
+}
+
+
+def _key_kind(key_data: Binding, layer_name: str = '') -> str:
+    value = key_data.value
+    if value in KEY_VALUE_HANDLERS:
+        return value
+    return '&<behavior>' if value.startswith('&') else '<keycode>'
+
+
+@profiled_calls('convert_zmk_key', _key_kind)
+def convert_zmk_key(key_data: Binding, layer_name: str = '') -> str:
+    """Convert ZMK key data (a lowered Binding, see lower_binding) to readable string - MUCH BETTER!"""
+    value, params = key_data
+
+    handler = KEY_VALUE_HANDLERS.get(value)
+    if handler:
+        return handler(key_data, params, layer_name)
     elif value.startswith('&'):
         # Direct behavior reference
         result = parse_custom_behavior_properly(value, layer_name)
-        return add_spaces_to_long_words(result)
     else:
         # Direct key value
         result = ZMK_KEY_MAPPING.get(value, value)
-        return add_spaces_to_long_words(result)
+    return add_spaces_to_long_words(result)
+
+
+# Custom behavior rule engine
+# Behavior name → handler(behavior, is_overlay) for exact names like &kp, &mo
+BEHAVIOR_HANDLERS: Dict[str, Callable[[str, bool], str]] = {}
+# Behavior name prefix → handler for families like &emoji_*, &LeftPinky*
+BEHAVIOR_PREFIX_HANDLERS: Dict[str, Callable[[str, bool], str]] = {}
+# Behavior name → resolved handler, so each name is matched against the rules once
+_resolved_behavior_handlers: Dict[str, Callable[[str, bool], str]] = {}
+
+BEHAVIOR_NAME_PATTERN = LazyPattern(r'[^\s(]*')
+CMD_COMBO_PATTERN = LazyPattern(r'_?C\(([A-Z])\)')
+
+
+def behavior_handler(*names: str, prefix: bool = False):
+    """Register a custom behavior handler under exact names (or name prefixes)"""
+    def register(handler):
+        table = BEHAVIOR_PREFIX_HANDLERS if prefix else BEHAVIOR_HANDLERS
+        for name in names:
+            table[name] = handler
+        _resolved_behavior_handlers.clear()
+        return handler
+    return register
+
+
+def resolve_behavior_handler(name: str) -> Callable[[str, bool], str]:
+    """Find the handler for a behavior name: exact match, then longest prefix"""
+    handler = _resolved_behavior_handlers.get(name)
+    if handler is None:
+        handler = BEHAVIOR_HANDLERS.get(name)
+        if handler is None:
+            prefixes = [p for p in BEHAVIOR_PREFIX_HANDLERS if name.startswith(p)]
+            if prefixes:
+                handler = BEHAVIOR_PREFIX_HANDLERS[max(prefixes, key=len)]
+            else:
+                handler = _parse_unregistered_behavior
+        _resolved_behavior_handlers[name] = handler
+    return handler
+
 
+def _behavior_rule(behavior_str: str, layer_name: str = '') -> str:
+    """The rule a behavior is handled by: its exact name, "prefix*", or <unregistered>"""
+    name = BEHAVIOR_NAME_PATTERN.match(behavior_str.strip()).group()
+    if name in BEHAVIOR_HANDLERS:
+        return name
+    prefixes = [p for p in BEHAVIOR_PREFIX_HANDLERS if name.startswith(p)]
+    return f'{max(prefixes, key=len)}*' if prefixes else '<unregistered>'
 
+
+@profiled_calls('parse_custom_behavior_properly', _behavior_rule)
 def parse_custom_behavior_properly(behavior_str: str, layer_name: str = '') -> str:
     """Parse custom ZMK behaviors PROPERLY - no more garbage!"""
     if not behavior_str:
-        raise ValueError("Empty behavior string provided")
+        raise UnknownBehaviorError("Empty behavior string provided")
 
     behavior = behavior_str.strip()
+    name = BEHAVIOR_NAME_PATTERN.match(behavior).group()
+    result = resolve_behavior_handler(name)(behavior, is_overlay_layer(layer_name))
+    if result is None:
+        # Unknown behavior - fail explicitly
+        clean_behavior = behavior.replace('&', '').replace('_', '').upper()
+        raise UnknownBehaviorError(f"Unknown behavior '{behavior_str}' (cleaned: '{clean_behavior}'). Available in ZMK_KEY_MAPPING: {list(ZMK_KEY_MAPPING.keys())[:20]}...")
+    return result
+
+
+def _cmd_combo_label(text: str) -> str:
+    """Handle any CMD combinations like _C(L), C(K), etc."""
+    match = CMD_COMBO_PATTERN.search(text)
+    if match:
+        return f'⌘{match.group(1)}'
+    return '⌘'  # CMD key for macOS
+
+
+def _parse_unregistered_behavior(behavior: str, is_overlay: bool) -> Optional[str]:
+    """Fallback for behaviors without a registered handler (None if unknown)"""
+    if '_HOME' in behavior:
+        return 'HOME'
+    elif '_END' in behavior:
+        return 'END'
+    elif 'C(' in behavior:
+        return _cmd_combo_label(behavior)
 
-    # HOME ROW MODS: Show modifier symbols on overlay layers, tap keys on base layer
-    is_overlay_layer = layer_name not in ['', 'GRAPHITE']
+    # Try direct mapping after cleaning up
+    clean_behavior = behavior.replace('&', '').replace('_', '').upper()
+    return ZMK_KEY_MAPPING.get(clean_behavior)
 
-    if 'LeftPinky' in behavior or 'RightPinky' in behavior:
-        if is_overlay_layer:
-            return '⌃'  # Control symbol for macOS-style keymap
-        if '(' in behavior and ')' in behavior:
-            tap_key = behavior.split('(')[1].split(',')[0].strip()
-            return ZMK_KEY_MAPPING.get(tap_key, tap_key)
-        return 'N'  # Default Graphite pinky tap key
-    elif 'LeftRingy' in behavior or 'RightRingy' in behavior:
-        if is_overlay_layer:
-            return '⌥'  # Alt/Option symbol
-        if '(' in behavior and ')' in behavior:
-            tap_key = behavior.split('(')[1].split(',')[0].strip()
-            return ZMK_KEY_MAPPING.get(tap_key, tap_key)
-        return 'R'  # Default Graphite ring tap key
-    elif 'LeftMiddy' in behavior or 'RightMiddy' in behavior:
-        if is_overlay_layer:
-            return '⌘'  # Command symbol for macOS
-        if '(' in behavior and ')' in behavior:
-            tap_key = behavior.split('(')[1].split(',')[0].strip()
-            return ZMK_KEY_MAPPING.get(tap_key, tap_key)
-        return 'T'  # Default Graphite middle tap key
-    elif 'LeftIndex' in behavior or 'RightIndex' in behavior:
-        if is_overlay_layer:
-            return '⇧'  # Shift symbol
+
+# HOME ROW MODS: finger → (overlay modifier symbol, default Graphite tap key)
+HOME_ROW_MOD_FINGERS = {
+    'Pinky': ('⌃', 'N'),  # Control symbol for macOS-style keymap
+    'Ringy': ('⌥', 'R'),  # Alt/Option symbol
+    'Middy': ('⌘', 'T'),  # Command symbol for macOS
+    'Index': ('⇧', 'S'),  # Shift symbol
+}
+
+
+def _home_row_mod_handler(modifier_symbol: str, default_tap_key: str):
+    """Show modifier symbols on overlay layers, tap keys on base layer"""
+    def parse(behavior: str, is_overlay: bool) -> str:
+        if is_overlay:
+            return modifier_symbol
         if '(' in behavior and ')' in behavior:
             tap_key = behavior.split('(')[1].split(',')[0].strip()
             return ZMK_KEY_MAPPING.get(tap_key, tap_key)
-        return 'S'  # Default Graphite index tap key
-    elif 'left_pinky' in behavior or 'left_ringy_tap' in behavior or 'left_middy_tap' in behavior or 'left_index_tap' in behavior or 'right_pinky_tap' in behavior or 'right_ringy_tap' in behavior or 'right_middy_tap' in behavior or 'right_index_tap' in behavior:
-        # Handle tap behaviors with key extraction
+        return default_tap_key
+    return parse
+
+
+for _finger, (_symbol, _tap_key) in HOME_ROW_MOD_FINGERS.items():
+    behavior_handler(f'&Left{_finger}', f'&Right{_finger}', prefix=True)(
+        _home_row_mod_handler(_symbol, _tap_key))
+
+# The layouts/*.json bases call their ring finger mods &LeftRing1 (home row) and &LeftRing2 (top row)
+behavior_handler('&LeftRing', '&RightRing', prefix=True)(_home_row_mod_handler(*HOME_ROW_MOD_FINGERS['Ringy']))
+
+
+# Tap behaviors: name prefix → fallback tap key when no key parameter is given
+TAP_BEHAVIOR_DEFAULTS = {
+    '&left_pinky': 'Q',  # Default left pinky tap
+    '&left_ringy_tap': 'F1',  # Default for left ring finger on function row
+    '&left_middy_tap': 'F2',  # Default for left middle finger on function row
+    '&left_index_tap': 'F3',  # Default for left index finger on function row
+    '&right_pinky_tap': 'F10',  # Default for right pinky on function row
+    '&right_ringy_tap': 'F9',  # Default for right ring finger on function row
+    '&right_middy_tap': 'F8',  # Default for right middle finger on function row
+    '&right_index_tap': 'F7',  # Default for right index finger on function row
+}
+
+
+def _tap_behavior_handler(default_tap_key: str):
+    """Handle tap behaviors with key extraction"""
+    def parse(behavior: str, is_overlay: bool) -> str:
         parts = behavior.split()
         if len(parts) >= 2:
             tap_key = parts[-1]  # Last part should be tap key
             return ZMK_KEY_MAPPING.get(tap_key, tap_key)
-        # Fallback for specific behaviors without parameters
-        if 'left_pinky' in behavior:
-            return 'Q'  # Default left pinky tap
-        elif 'left_ringy_tap' in behavior:
-            return 'F1'  # Default for left ring finger on function row
-        elif 'left_middy_tap' in behavior:
-            return 'F2'  # Default for left middle finger on function row  
-        elif 'left_index_tap' in behavior:
-            return 'F3'  # Default for left index finger on function row
-        elif 'right_pinky_tap' in behavior:
-            return 'F10'  # Default for right pinky on function row
-        elif 'right_ringy_tap' in behavior:
-            return 'F9'  # Default for right ring finger on function row
-        elif 'right_middy_tap' in behavior:
-            return 'F8'  # Default for right middle finger on function row  
-        elif 'right_index_tap' in behavior:
-            return 'F7'  # Default for right index finger on function row
-        raise ValueError(f"Unknown tap behavior: {behavior}")
-
-    # Handle Graphite mod-morph behaviors (show the base character)
-    elif '&gr_au' in behavior:
-        return "'"  # Graphite apostrophe/underscore
-    elif '&gr_cm' in behavior:
-        return ','  # Graphite comma/question_mark
-    elif '&gr_pd' in behavior:
-        return '.'  # Graphite period/greater_than
-    elif '&gr_fs' in behavior:
-        return '/'  # Graphite forward_slash/less_than
-    elif '&gr_mi' in behavior:
-        return '-'  # Graphite minus/double_quote
-
-    # Handle special symbols (parang = parenthesis)
-    elif 'parang_left' in behavior:
-        return '('  # left_parenthesis_and_less_than
-    elif 'parang_right' in behavior:
-        return ')'  # right_parenthesis_and_greater_than
-
-    # Handle direct keypresses that were showing mod names
-    elif '&kp ' in behavior:
-        parts = behavior.split()
-        if len(parts) >= 2:
-            key_code = parts[1]
-
-            # Handle CMD combinations like _C(L), C(K), etc. FIRST
-            if '_C(' in key_code or 'C(' in key_code:
-                import re
-                match = re.search(r'_?C\(([A-Z])\)', key_code)
-                if match:
-                    return f'⌘{match.group(1)}'
-                return '⌘'
-
-            # For home row mod constants on overlay layers, show modifier symbols
-            if is_overlay_layer:
-                if 'LEFT_PINKY_MOD' in key_code or 'RIGHT_PINKY_MOD' in key_code:
-                    return '⌃'  # Control symbol for macOS-style keymap
-                elif 'LEFT_RINGY_MOD' in key_code or 'RIGHT_RINGY_MOD' in key_code:
-                    return '⌥'  # Alt/Option symbol
-                elif 'LEFT_MIDDY_MOD' in key_code or 'RIGHT_MIDDY_MOD' in key_code:
-                    return '⌘'  # Command symbol for macOS
-                elif 'LEFT_INDEX_MOD' in key_code or 'RIGHT_INDEX_MOD' in key_code:
-                    return '⇧'  # Shift symbol
-                elif 'LGUI' in key_code or 'RGUI' in key_code:
-                    return '⌘'  # Fixed: CMD not "LG"!
-            # For home row mod constants on base layer, show the tap key
-            key_code_clean = key_code.replace('_', '')
-            if 'LEFTPINKYMOD' in key_code_clean or 'RIGHTPINKYMOD' in key_code_clean:
-                return 'N'
-            elif 'LEFTRINGYMOD' in key_code_clean or 'RIGHTRINGYMOD' in key_code_clean:
-                return 'R'
-            elif 'LEFTMIDDYMOD' in key_code_clean or 'RIGHTMIDDYMOD' in key_code_clean:
-                return 'T'
-            elif 'LEFTINDEXMOD' in key_code_clean or 'RIGHTINDEXMOD' in key_code_clean:
-                return 'S'
-            return ZMK_KEY_MAPPING.get(key_code_clean, key_code_clean)
-
-    # Handle layer switching behaviors
-    elif '&to ' in behavior:
-        # Extract layer number from &to behavior
-        parts = behavior.split()
-        if len(parts) >= 2:
-            layer_num = parts[1]
-            return f'Layer {layer_num}'
-        return 'Layer'
-    # Handle other behaviors
-    elif '&magic' in behavior:
-        return 'MAGIC'
-    elif '&lower' in behavior:
-        return 'LOWER'
-    elif '&mo ' in behavior:
-        # Layer access - extract layer name
-        if 'LAYER_MouseSlow' in behavior:
-            return 'SlowMouse'
-        elif 'LAYER_MouseFast' in behavior:
-            return 'FastMouse'
-        elif 'LAYER_MouseWarp' in behavior:
-            return 'WarpMouse'
-        elif 'LAYER_' in behavior:
-            # Extract layer name
-            layer_part = behavior.split('LAYER_')[1].split()[0]
-            return layer_part[:8]  # Truncate long names
-        return 'Layer'
-    elif '&sk' in behavior:
-        # Sticky keys - use lightning bolt ⚡ like your Dart code
-        if 'RIGHT_INDEX_MOD' in behavior or 'LEFT_INDEX_MOD' in behavior:
-            return '⚡⇧'  # Sticky Shift
-        elif 'RIGHT_MIDDY_MOD' in behavior or 'LEFT_MIDDY_MOD' in behavior:
-            return '⚡⌘'  # Sticky CMD (macOS)
-        elif 'RIGHT_RINGY_MOD' in behavior or 'LEFT_RINGY_MOD' in behavior:
-            return '⚡⌥'  # Sticky ALT (macOS)
-        elif 'RIGHT_PINKY_MOD' in behavior or 'LEFT_PINKY_MOD' in behavior:
-            return '⚡⌃'  # Sticky CTRL (macOS)
-        elif 'LSHIFT' in behavior or 'RSHIFT' in behavior:
-            return '⚡⇧'
-        elif 'LGUI' in behavior or 'RGUI' in behavior:
-            return '⚡⌘'
-        elif 'LALT' in behavior or 'RALT' in behavior:
-            return '⚡⌥'
-        elif 'LCTRL' in behavior or 'RCTRL' in behavior:
-            return '⚡⌃'
-        # Check if it's a standard ZMK modifier
-        parts = behavior.split()
-        if len(parts) >= 2:
-            mod_key = parts[1]
-            if mod_key in ['LSHIFT', 'RSHIFT', 'SHIFT']:
-                return '⚡⇧'
-            elif mod_key in ['LGUI', 'RGUI', 'LCMD', 'RCMD', 'CMD']:
-                return '⚡⌘'
-            elif mod_key in ['LALT', 'RALT', 'ALT']:
-                return '⚡⌥'
-            elif mod_key in ['LCTRL', 'RCTRL', 'CTRL']:
-                return '⚡⌃'
-        return '⚡⇧'  # Most common case
-    elif '&tog' in behavior:
-        # Layer toggles - show what they toggle
-        if 'LAYER_Function' in behavior:
-            return '🔒Fn'
-        elif 'LAYER_Cursor' in behavior:
-            return '🔒Cur'
-        elif 'LAYER_Number' in behavior:
-            return '🔒Num'
-        elif 'LAYER_Symbol' in behavior:
-            return '🔒Sym'
-        elif 'LAYER_Mouse' in behavior:
-            return '🔒Mouse'
-        elif 'LAYER_System' in behavior:
-            return '🔒Sys'
-        elif 'LAYER_Emoji' in behavior:
-            return '🔒Emoji'
-        elif 'LAYER_World' in behavior:
-            return '🔒World'
-        elif 'LAYER_' in behavior:
-            # Extract layer name
-            layer_part = behavior.split('LAYER_')[1].split()[0]
-            return f'🔒{layer_part[:4]}'  # Truncate to 4 chars
-        return '🔄'
-    elif '&rgb_ug' in behavior:
-        # RGB underglow controls
-        if 'RGB_TOG' in behavior:
-            return '🌈'
-        elif 'RGB_HUI' in behavior:
-            return 'Hue+'
-        elif 'RGB_HUD' in behavior:
-            return 'Hue-'
-        elif 'RGB_SAI' in behavior:
-            return 'Sat+'
-        elif 'RGB_SAD' in behavior:
-            return 'Sat-'
-        elif 'RGB_BRI' in behavior:
-            return 'Bright+'
-        elif 'RGB_BRD' in behavior:
-            return 'Bright-'
-        elif 'RGB_SPI' in behavior:
-            return 'Speed+'
-        elif 'RGB_SPD' in behavior:
-            return 'Speed-'
-        elif 'RGB_EFF' in behavior:
-            return 'Effect+'
-        elif 'RGB_EFR' in behavior:
-            return 'Effect-'
-        return 'RGB'
-    elif '&msc' in behavior:
-        # Mouse scroll - extract the direction
-        if 'SCRL_UP' in behavior:
-            return 'Scroll↑'
-        elif 'SCRL_DOWN' in behavior:
-            return 'Scroll↓'
-        elif 'SCRL_LEFT' in behavior:
-            return 'Scroll←'
-        elif 'SCRL_RIGHT' in behavior:
-            return 'Scroll→'
-        return 'Scroll'
-    elif '&mmv' in behavior:
-        # Mouse movement - extract direction (no "Move" prefix!)
-        if 'MOVE_UP' in behavior:
-            return '↑'
-        elif 'MOVE_DOWN' in behavior:
-            return '↓'
-        elif 'MOVE_LEFT' in behavior:
-            return '←'
-        elif 'MOVE_RIGHT' in behavior:
-            return '→'
-        return 'Move'
-    elif '&mkp' in behavior:
-        # Mouse click - extract button
-        if 'LCLK' in behavior:
-            return 'LeftClick'
-        elif 'RCLK' in behavior:
-            return 'RightClick'
-        elif 'MCLK' in behavior:
-            return 'MiddleClick'
-        elif 'MB4' in behavior:
-            return 'Button4'
-        elif 'MB5' in behavior:
-            return 'Button5'
-        return 'Click'
-    elif '&linux_magic_sysrq' in behavior:
-        return 'SysRq'  # Linux Magic SysRq key
-    elif '&bt' in behavior:
-        # Bluetooth behavior - extract the command from params
-        if 'BT_CLR' in behavior:
-            return 'BT Clear'
-        elif 'BT_SEL' in behavior:
-            # Extract bluetooth profile number
-            if '0' in behavior:
-                return 'BT 0'
-            elif '1' in behavior:
-                return 'BT 1'
-            elif '2' in behavior:
-                return 'BT 2'
-            elif '3' in behavior:
-                return 'BT 3'
-            elif '4' in behavior:
-                return 'BT 4'
-            return 'BT Sel'
-        elif 'BT_NXT' in behavior:
-            return 'BT Next'
-        elif 'BT_PRV' in behavior:
-            return 'BT Prev'
-        return 'BT'
-    elif '&abc' in behavior:
-        return 'ABC'  # Input method switch to alphabetic
-    elif '&cyrilic' in behavior:
-        return 'АБВ'  # Cyrillic input method
-    elif '&bootloader' in behavior:
-        return 'Bootldr'  # Bootloader mode
-    elif '&reset' in behavior:
-        return 'Reset'  # Keyboard reset
-    elif '&out' in behavior:
-        # Output selection behavior
-        if 'OUT_USB' in behavior:
-            return 'USB Out'
-        elif 'OUT_BLE' in behavior:
-            return 'BT Out'
-        elif 'OUT_TOG' in behavior:
-            return 'Out Toggle'
-        return 'Output'
-    elif '&space' in behavior:
-        return '⎵'
-    elif '&thumb' in behavior:
-        # Extract tap action from thumb behavior
-        parts = behavior.split()
-        if len(parts) >= 3:
-            tap_key = parts[-1]
-            return ZMK_KEY_MAPPING.get(tap_key, tap_key)
-        return 'THUMB'
-    elif '&thumb_kp' in behavior:
-        if '_END' in behavior:
-            return 'END'
-        elif '_HOME' in behavior:
-            return 'HOME'
-        return 'THUMBKP'
-    elif '&kp _HOME' in behavior:
-        return 'HOME'
-    elif '&kp _END' in behavior:
-        return 'END'
-    elif '_HOME' in behavior:
-        return 'HOME'
-    elif '_END' in behavior:
-        return 'END'
-    elif '_C(' in behavior or 'C(' in behavior:
-        # Handle any CMD combinations like _C(L), C(K), etc.
-        import re
-        match = re.search(r'_?C\(([A-Z])\)', behavior)
-        if match:
-            return f'⌘{match.group(1)}'
-        return '⌘'  # CMD key for macOS
-    elif '&extend_' in behavior:
-        # Text selection extension functions
-        if '&extend_word' in behavior:
-            return 'Ext Word'
-        elif '&extend_line' in behavior:
-            return 'Ext Line'
-        elif '&extend_all' in behavior:
-            return 'Ext All'
-        return 'Extend'
-    elif '&select_' in behavior:
-        # Text selection functions
-        if '&select_word' in behavior:
-            return 'Sel Word'
-        elif '&select_line' in behavior:
-            return 'Sel Line'
-        elif '&select_all' in behavior:
-            return 'Sel All'
-        elif '&select_none' in behavior:
-            return 'Clear'
-        return 'Select'
-    elif '&emoji_' in behavior:
-        # Load emoji mappings from emoji.yaml file
-        try:
-            import yaml
-            with open('emoji.yaml', 'r', encoding='utf-8') as f:
-                emoji_data = yaml.safe_load(f)
-        except ImportError as e:
-            raise ImportError(f"PyYAML module not available for emoji parsing: {e}")
-        except FileNotFoundError as e:
-            raise FileNotFoundError(f"emoji.yaml file not found: {e}")
-
-        # Extract behavior name without &emoji_ prefix
-        behavior_name = behavior.replace('&emoji_', '').strip()
-
-        # Handle special preset behaviors first
-        preset_mappings = {
-            'skin_tone_preset': '🏼',  # medium_light_skin_tone
-            'gender_sign_preset': '♀️',  # female_sign 
-            'hair_style_preset': '🦱',  # curly_hair
-        }
-        if behavior_name in preset_mappings:
-            return preset_mappings[behavior_name]
-
-        # First check direct codepoints (handle both string and numeric keys)
-        if 'codepoints' in emoji_data:
-            if behavior_name in emoji_data['codepoints']:
-                return emoji_data['codepoints'][behavior_name]
-            # Also try converting behavior_name to int for numeric keys like "100"
+        return default_tap_key
+    return parse
+
+
+for _name, _tap_key in TAP_BEHAVIOR_DEFAULTS.items():
+    behavior_handler(_name, prefix=True)(_tap_behavior_handler(_tap_key))
+
+
+@behavior_handler('&plain', '&crumb')
+def _parse_layer_tap_key(behavior: str, is_overlay: bool) -> str:
+    """layouts/*.json layer-taps (&plain LAYER_Typing D, &crumb LAYER_Emoji BSLH) show their tap key"""
+    parts = behavior.split()
+    if len(parts) < 3:
+        raise UnknownBehaviorError(f"Layer-tap behavior without a tap key: {behavior!r}")
+    return ZMK_KEY_MAPPING.get(parts[-1], parts[-1])
+
+
+# Behaviors that always render the same label, keyed by name prefix
+CONSTANT_BEHAVIOR_LABELS = {
+    # Graphite mod-morph behaviors (show the base character)
+    '&gr_au': "'",  # Graphite apostrophe/underscore
+    '&gr_cm': ',',  # Graphite comma/question_mark
+    '&gr_pd': '.',  # Graphite period/greater_than
+    '&gr_fs': '/',  # Graphite forward_slash/less_than
+    '&gr_mi': '-',  # Graphite minus/double_quote
+    # Special symbols (parang = parenthesis)
+    '&parang_left': '(',  # left_parenthesis_and_less_than
+    '&parang_right': ')',  # right_parenthesis_and_greater_than
+    '&thumb_parang_left': '(',
+    '&thumb_parang_right': ')',
+    '&magic': 'MAGIC',
+    '&lower': 'LOWER',
+    '&linux_magic_sysrq': 'SysRq',  # Linux Magic SysRq key
+    '&abc': 'ABC',  # Input method switch to alphabetic
+    '&cyrilic': 'АБВ',  # Cyrillic input method
+    '&bootloader': 'Bootldr',  # Bootloader mode
+    '&reset': 'Reset',  # Keyboard reset
+    '&space': '⎵',
+    '&caps_word': '⇪Word',
+}
+
+for _name, _label in CONSTANT_BEHAVIOR_LABELS.items():
+    behavior_handler(_name, prefix=True)(lambda behavior, is_overlay, label=_label: label)
+
+
+def _first_substring_label(behavior: str, labels: Dict[str, str], default: str) -> str:
+    """Return the label of the first table entry found in the behavior string"""
+    for needle, label in labels.items():
+        if needle in behavior:
+            return label
+    return default
+
+
+# Home row mod constants on overlay layers show modifier symbols
+OVERLAY_MOD_CONSTANT_LABELS = {
+    'LEFT_PINKY_MOD': '⌃', 'RIGHT_PINKY_MOD': '⌃',  # Control symbol for macOS-style keymap
+    'LEFT_RINGY_MOD': '⌥', 'RIGHT_RINGY_MOD': '⌥',  # Alt/Option symbol
+    'LEFT_MIDDY_MOD': '⌘', 'RIGHT_MIDDY_MOD': '⌘',  # Command symbol for macOS
+    'LEFT_INDEX_MOD': '⇧', 'RIGHT_INDEX_MOD': '⇧',  # Shift symbol
+    'LGUI': '⌘', 'RGUI': '⌘',  # Fixed: CMD not "LG"!
+}
+# Home row mod constants on base layer show the tap key (matched without underscores)
+BASE_MOD_CONSTANT_LABELS = {
+    'LEFTPINKYMOD': 'N', 'RIGHTPINKYMOD': 'N',
+    'LEFTRINGYMOD': 'R', 'RIGHTRINGYMOD': 'R',
+    'LEFTMIDDYMOD': 'T', 'RIGHTMIDDYMOD': 'T',
+    'LEFTINDEXMOD': 'S', 'RIGHTINDEXMOD': 'S',
+}
+
+
+@behavior_handler('&kp')
+def _parse_keypress(behavior: str, is_overlay: bool) -> str:
+    """Handle direct keypresses that were showing mod names"""
+    parts = behavior.split()
+    if len(parts) < 2:
+        return _parse_unregistered_behavior(behavior, is_overlay)
+    key_code = parts[1]
+
+    # Handle CMD combinations like _C(L), C(K), etc. FIRST
+    if 'C(' in key_code:
+        return _cmd_combo_label(key_code)
+
+    if is_overlay:
+        label = _first_substring_label(key_code, OVERLAY_MOD_CONSTANT_LABELS, None)
+        if label:
+            return label
+    key_code_clean = key_code.replace('_', '')
+    label = _first_substring_label(key_code_clean, BASE_MOD_CONSTANT_LABELS, None)
+    if label:
+        return label
+    return ZMK_KEY_MAPPING.get(key_code_clean, key_code_clean)
+
+
+@behavior_handler('&to')
+def _parse_layer_switch(behavior: str, is_overlay: bool) -> str:
+    """Extract layer number from &to behavior"""
+    parts = behavior.split()
+    if len(parts) < 2:
+        return _parse_unregistered_behavior(behavior, is_overlay)
+    return f'Layer {parts[1]}'
+
+
+MOMENTARY_LAYER_LABELS = {
+    'LAYER_MouseSlow': 'SlowMouse',
+    'LAYER_MouseFast': 'FastMouse',
+    'LAYER_MouseWarp': 'WarpMouse',
+}
+
+
+@behavior_handler('&mo')
+def _parse_momentary_layer(behavior: str, is_overlay: bool) -> str:
+    """Layer access - extract layer name"""
+    if ' ' not in behavior:
+        return _parse_unregistered_behavior(behavior, is_overlay)
+    label = _first_substring_label(behavior, MOMENTARY_LAYER_LABELS, None)
+    if label:
+        return label
+    elif 'LAYER_' in behavior:
+        layer_part = behavior.split('LAYER_')[1].split()[0]
+        return layer_part[:8]  # Truncate long names
+    return 'Layer'
+
+
+# Sticky keys - use lightning bolt ⚡ like your Dart code
+STICKY_KEY_LABELS = {
+    'RIGHT_INDEX_MOD': '⚡⇧', 'LEFT_INDEX_MOD': '⚡⇧',  # Sticky Shift
+    'RIGHT_MIDDY_MOD': '⚡⌘', 'LEFT_MIDDY_MOD': '⚡⌘',  # Sticky CMD (macOS)
+    'RIGHT_RINGY_MOD': '⚡⌥', 'LEFT_RINGY_MOD': '⚡⌥',  # Sticky ALT (macOS)
+    'RIGHT_PINKY_MOD': '⚡⌃', 'LEFT_PINKY_MOD': '⚡⌃',  # Sticky CTRL (macOS)
+    'LSHIFT': '⚡⇧', 'RSHIFT': '⚡⇧',
+    'LGUI': '⚡⌘', 'RGUI': '⚡⌘',
+    'LALT': '⚡⌥', 'RALT': '⚡⌥',
+    'LCTRL': '⚡⌃', 'RCTRL': '⚡⌃',
+}
+# Standard ZMK modifier names given as the sticky key parameter
+STICKY_MODIFIER_LABELS = {
+    'SHIFT': '⚡⇧', 'LSFT': '⚡⇧', 'RSFT': '⚡⇧',
+    'LCMD': '⚡⌘', 'RCMD': '⚡⌘', 'CMD': '⚡⌘',
+    'ALT': '⚡⌥',
+    'CTRL': '⚡⌃',
+}
+
+
+@behavior_handler('&sk', '&sticky_key_modtap', prefix=True)
+def _parse_sticky_key(behavior: str, is_overlay: bool) -> str:
+    label = _first_substring_label(behavior, STICKY_KEY_LABELS, None)
+    if label:
+        return label
+    parts = behavior.split()
+    if len(parts) >= 2:
+        return STICKY_MODIFIER_LABELS.get(parts[1], '⚡⇧')
+    return '⚡⇧'  # Most common case
+
+
+# Layer toggles - show what they toggle
+TOGGLE_LAYER_LABELS = {
+    'LAYER_Function': '🔒Fn',
+    'LAYER_Cursor': '🔒Cur',
+    'LAYER_Number': '🔒Num',
+    'LAYER_Symbol': '🔒Sym',
+    'LAYER_Mouse': '🔒Mouse',
+    'LAYER_System': '🔒Sys',
+    'LAYER_Emoji': '🔒Emoji',
+    'LAYER_World': '🔒World',
+}
+
+
+@behavior_handler('&tog', prefix=True)
+def _parse_layer_toggle(behavior: str, is_overlay: bool) -> str:
+    label = _first_substring_label(behavior, TOGGLE_LAYER_LABELS, None)
+    if label:
+        return label
+    elif 'LAYER_' in behavior:
+        layer_part = behavior.split('LAYER_')[1].split()[0]
+        return f'🔒{layer_part[:4]}'  # Truncate to 4 chars
+    return '🔄'
+
+
+def _substring_label_handler(labels: Dict[str, str], default: str):
+    """Build a handler that labels a behavior by the first matching parameter"""
+    def parse(behavior: str, is_overlay: bool) -> str:
+        return _first_substring_label(behavior, labels, default)
+    return parse
+
+
+behavior_handler('&rgb_ug', prefix=True)(_substring_label_handler(
+    {**RGB_COMMAND_LABELS, 'RGB_TOG': '🌈'}, 'RGB'))
+behavior_handler('&msc', prefix=True)(_substring_label_handler(MOUSE_SCROLL_LABELS, 'Scroll'))
+behavior_handler('&mmv', prefix=True)(_substring_label_handler(MOUSE_MOVE_LABELS, 'Move'))
+behavior_handler('&mkp', prefix=True)(_substring_label_handler({
+    'LCLK': 'LeftClick', 'RCLK': 'RightClick', 'MCLK': 'MiddleClick',
+    'MB4': 'Button4', 'MB5': 'Button5',
+}, 'Click'))
+behavior_handler('&out', prefix=True)(_substring_label_handler({
+    'OUT_USB': 'USB Out', 'OUT_BLE': 'BT Out', 'OUT_TOG': 'Out Toggle',
+}, 'Output'))
+# Text selection extension and selection functions
+behavior_handler('&extend_', prefix=True)(_substring_label_handler({
+    '&extend_word': 'Ext Word', '&extend_line': 'Ext Line', '&extend_all': 'Ext All',
+}, 'Extend'))
+behavior_handler('&select_', prefix=True)(_substring_label_handler({
+    '&select_word': 'Sel Word', '&select_line': 'Sel Line',
+    '&select_all': 'Sel All', '&select_none': 'Clear',
+}, 'Select'))
+
+
+@behavior_handler('&bt', prefix=True)
+def _parse_bluetooth(behavior: str, is_overlay: bool) -> str:
+    """Bluetooth behavior - extract the command from params"""
+    if 'BT_CLR' in behavior:
+        return 'BT Clear'
+    elif 'BT_SEL' in behavior:
+        # Extract bluetooth profile number
+        for profile in '01234':
+            if profile in behavior:
+                return f'BT {profile}'
+        return 'BT Sel'
+    elif 'BT_NXT' in behavior:
+        return 'BT Next'
+    elif 'BT_PRV' in behavior:
+        return 'BT Prev'
+    return 'BT'
+
+
+@behavior_handler('&engram_', '&plain_engram_', prefix=True)
+def _parse_engram_key(behavior: str, is_overlay: bool) -> str:
+    """Engram's shift-remapped keys (&engram_N1, &plain_engram_COMMA ...) show their unshifted key"""
+    key_code = BEHAVIOR_NAME_PATTERN.match(behavior).group().split('engram_', 1)[1]
+    return ZMK_KEY_MAPPING.get(key_code, key_code)
+
+
+@behavior_handler('&thumb', prefix=True)
+def _parse_thumb(behavior: str, is_overlay: bool) -> str:
+    """Extract tap action from thumb behavior"""
+    parts = behavior.split()
+    if len(parts) >= 3:
+        tap_key = parts[-1]
+        return ZMK_KEY_MAPPING.get(tap_key, tap_key)
+    return 'THUMB'
+
+
+class CharacterTable:
+    """Flat lookup indices over a character YAML file (emoji.yaml, world.yaml)"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.codepoints = data.get('codepoints', {})
+        characters = data.get('characters', {})
+
+        # group_item behavior name → first variant (without shift)
+        self.group_items = {}
+        for group_name, group_items in characters.items():
+            for item_name, variants in group_items.items():
+                if isinstance(variants, dict):
+                    variants = list(variants.values())[0]
+                self.group_items.setdefault(f'{group_name}_{item_name}', variants)
+
+        # transform group → its base character, or None if it can't be resolved
+        self.transform_bases = {}
+        for letter, transform in data.get('transforms', {}).items():
+            base_transform = transform.get('base')
+            char_variants = characters.get(letter, {}).get(base_transform) if base_transform else None
+            if isinstance(char_variants, dict):
+                # The appropriate base version (without shift)
+                char_variants = char_variants.get('lower', char_variants.get('regular', list(char_variants.values())[0]))
+            self.transform_bases[letter] = char_variants
+
+    def codepoint(self, name: str, numeric: bool = False) -> Optional[str]:
+        """Direct codepoint lookup, optionally also trying numeric keys like 100"""
+        if name in self.codepoints:
+            return self.codepoints[name]
+        if numeric:
             try:
-                numeric_key = int(behavior_name)
-                if numeric_key in emoji_data['codepoints']:
-                    return emoji_data['codepoints'][numeric_key]
+                return self.codepoints.get(int(name))
             except ValueError:
                 pass
+        return None
 
-        # Then check character groups (these have shift variants)
-        if 'characters' in emoji_data:
-            for group_name, group_items in emoji_data['characters'].items():
-                for item_name, variants in group_items.items():
-                    # Check if behavior matches group_item pattern
-                    expected_behavior = f'{group_name}_{item_name}'
-                    if behavior_name == expected_behavior:
-                        # Return the first variant (without shift)
-                        if isinstance(variants, dict):
-                            return list(variants.values())[0]
-                        return variants
-
-        # Raise exception for unknown emoji behaviors
-        raise ValueError(f"Emoji behavior '{behavior_name}' not found in emoji.yaml. Available codepoints: {list(emoji_data.get('codepoints', {}).keys())[:10]}...")
-
-    elif '&world_' in behavior:
-        # Load world character mappings from world.yaml file
-        try:
-            import yaml
-            with open('world.yaml', 'r', encoding='utf-8') as f:
-                world_data = yaml.safe_load(f)
-        except ImportError as e:
-            raise ImportError(f"PyYAML module not available for world character parsing: {e}")
-        except FileNotFoundError as e:
-            raise FileNotFoundError(f"world.yaml file not found: {e}")
-
-        # Extract behavior name without &world_ prefix
-        behavior_name = behavior.replace('&world_', '').strip()
-
-        # First check direct codepoints
-        if 'codepoints' in world_data and behavior_name in world_data['codepoints']:
-            return world_data['codepoints'][behavior_name]
-
-        # Handle transform-based behaviors like y_base, e_base, etc.
-        if 'transforms' in world_data and '_base' in behavior_name:
-            # Extract the letter (e.g., "y" from "y_base")
-            letter_orig = behavior_name.replace('_base', '')
-            letter_upper = letter_orig.upper()
-            letter_lower = letter_orig.lower()
-            
-            # Try both uppercase and lowercase (for letters vs words like "sign")
-            letter = None
-            if letter_upper in world_data['transforms']:
-                letter = letter_upper
-            elif letter_lower in world_data['transforms']:
-                letter = letter_lower
-            
-            if letter:
-                base_transform = world_data['transforms'][letter].get('base')
-                if base_transform and 'characters' in world_data:
-                    # Look up the base character
-                    if letter in world_data['characters'] and base_transform in world_data['characters'][letter]:
-                        char_variants = world_data['characters'][letter][base_transform]
-                        if isinstance(char_variants, dict):
-                            # Return the appropriate base version (without shift)
-                            return char_variants.get('lower', char_variants.get('regular', list(char_variants.values())[0]))
-                        return char_variants
-
-        # Then check character groups (these have shift variants)
-        if 'characters' in world_data:
-            for group_name, group_items in world_data['characters'].items():
-                for item_name, variants in group_items.items():
-                    # Check if behavior matches group_item pattern
-                    expected_behavior = f'{group_name}_{item_name}'
-                    if behavior_name == expected_behavior:
-                        # Return the first variant (without shift)
-                        if isinstance(variants, dict):
-                            return list(variants.values())[0]
-                        return variants
-
-        # Raise exception for unknown world behaviors
-        raise ValueError(f"World character '{behavior_name}' not found in world.yaml. Available codepoints: {list(world_data.get('codepoints', {}).keys())[:10]}...")
+    def transform_base(self, name: str) -> Optional[str]:
+        """Base character for transform behaviors like y_base, sign_base"""
+        letter = name.replace('_base', '')
+        # Try both uppercase and lowercase (for letters vs words like "sign")
+        if letter.upper() in self.transform_bases:
+            return self.transform_bases[letter.upper()]
+        return self.transform_bases.get(letter.lower())
 
-    # Try direct mapping after cleaning up
-    clean_behavior = behavior.replace('&', '').replace('_', '').upper()
-    if clean_behavior in ZMK_KEY_MAPPING:
-        return ZMK_KEY_MAPPING[clean_behavior]
+    def available_codepoints(self) -> List[Any]:
+        return list(self.codepoints.keys())[:10]
 
-    # Unknown behavior - fail explicitly
-    raise ValueError(f"Unknown behavior '{behavior_str}' (cleaned: '{clean_behavior}'). Available in ZMK_KEY_MAPPING: {list(ZMK_KEY_MAPPING.keys())[:20]}...")
 
+# Absolute path → ((mtime_ns, size), sha256, CharacterTable)
+_character_tables: Dict[str, Tuple[Tuple[int, int], str, CharacterTable]] = {}
 
-def parse_zmk_triggers(dtsi_filepath: str = "keymap.dtsi") -> Dict[str, str]:
-    """Parse actual ZMK trigger bindings from keymap.dtsi"""
-    triggers = {}
 
+def character_snapshot_path(filepath: str) -> str:
+    """emoji.yaml → emoji.snapshot.json, the JSON copy prebuilt by `rake snapshots`"""
+    return f'{os.path.splitext(filepath)[0]}.snapshot.json'
+
+
+def load_character_snapshot(filepath: str, digest: str) -> Optional[Dict[str, Any]]:
+    """The YAML data from a snapshot made from exactly this content, else None"""
     try:
-        with open(dtsi_filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
+        with open(character_snapshot_path(filepath), 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return snapshot.get('data') if snapshot.get('sha256') == digest else None
+
+
+def load_character_table(filepath: str) -> CharacterTable:
+    """Parse a character YAML file once per process; re-index only when its content hash changes
+
+    A matching JSON snapshot is read with the stdlib; PyYAML is only imported
+    when the snapshot is missing or was made from different YAML content.
+    """
+    import hashlib
+    path = os.path.abspath(filepath)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _character_tables.get(path)
+    if cached and cached[0] == signature:
+        return cached[2]
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if cached and cached[1] == digest:
+        table = cached[2]  # Touched but unchanged
+    else:
+        def parse():
+            data = load_character_snapshot(path, digest)
+            if data is None:
+                import yaml
+                data = yaml.safe_load(content.decode('utf-8'))
+            return CharacterTable(data)
+        table = cached_parse('characters', path, digest, parse)
+        if cached:
+            conversion_cache.clear()  # Cached labels may come from the old table
+    _character_tables[path] = (signature, digest, table)
+    return table
+
+
+# Character tables convert_keymap() was given, by file name; None reads the files on disk
+_character_sources = contextvars.ContextVar('character_sources', default=None)
+
+
+def character_table(filepath: str) -> CharacterTable:
+    """The character table the current conversion uses for emoji.yaml or world.yaml"""
+    sources = _character_sources.get()
+    if sources is None:
+        return load_character_table(filepath)
+    table = sources.get(filepath)
+    if table is None:
+        raise SourceError(f"No {filepath} character data was given for this conversion")
+    return table
+
+
+# Emoji presets that have no entry of their own in emoji.yaml
+EMOJI_PRESET_LABELS = {
+    'skin_tone_preset': '🏼',  # medium_light_skin_tone
+    'gender_sign_preset': '♀️',  # female_sign
+    'hair_style_preset': '🦱',  # curly_hair
+}
+
+
+@behavior_handler('&emoji_', prefix=True)
+def _parse_emoji(behavior: str, is_overlay: bool) -> str:
+    # Load emoji mappings from emoji.yaml file
+    try:
+        emoji_table = character_table('emoji.yaml')
+    except ImportError as e:
+        raise ImportError(f"PyYAML module not available for emoji parsing: {e}")
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"emoji.yaml file not found: {e}")
+
+    # Extract behavior name without &emoji_ prefix
+    behavior_name = behavior.replace('&emoji_', '').strip()
+
+    # Handle special preset behaviors first
+    if behavior_name in EMOJI_PRESET_LABELS:
+        return EMOJI_PRESET_LABELS[behavior_name]
+
+    # First check direct codepoints (handle both string and numeric keys),
+    # then character groups (these have shift variants)
+    for result in (emoji_table.codepoint(behavior_name, numeric=True),
+                   emoji_table.group_items.get(behavior_name)):
+        if result is not None:
+            return result
+
+    # Raise exception for unknown emoji behaviors
+    raise UnknownBehaviorError(f"Emoji behavior '{behavior_name}' not found in emoji.yaml. Available codepoints: {emoji_table.available_codepoints()}...")
+
+
+@behavior_handler('&world_', prefix=True)
+def _parse_world(behavior: str, is_overlay: bool) -> str:
+    # Load world character mappings from world.yaml file
+    try:
+        world_table = character_table('world.yaml')
+    except ImportError as e:
+        raise ImportError(f"PyYAML module not available for world character parsing: {e}")
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"world.yaml file not found: {e}")
+
+    # Extract behavior name without &world_ prefix
+    behavior_name = behavior.replace('&world_', '').strip()
+
+    # First check direct codepoints
+    result = world_table.codepoint(behavior_name)
+    # Handle transform-based behaviors like y_base, e_base, etc.
+    if result is None and '_base' in behavior_name:
+        result = world_table.transform_base(behavior_name)
+    # Then check character groups (these have shift variants)
+    if result is None:
+        result = world_table.group_items.get(behavior_name)
+    if result is not None:
+        return result
+
+    # Raise exception for unknown world behaviors
+    raise UnknownBehaviorError(f"World character '{behavior_name}' not found in world.yaml. Available codepoints: {world_table.available_codepoints()}...")
+
+
+# Devicetree tokens: every alternative is linear, so keymap.dtsi lexes in a single pass
+_DTSI_TOKEN = LazyPattern(r'''
+    # Whitespace, comments and preprocessor lines are skipped in front of each token
+    (?:\s+|//[^\n]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/
+      |\#(?:define|undef|include|ifdef|ifndef|if|elif|else|endif|error|warning|pragma)\b(?:\\\n|[^\n])*)*+
+    (?:
+        (?P<string>"[^"\\\n]*(?:\\.[^"\\\n]*)*")
+      | (?P<cells><[^>]*>)
+      | (?P<word>[\w#&@.+\-]+(?:,[\w#&@.+\-]+)*)
+      | (?P<punct>.)
+      | (?P<end>\Z)
+    )
+''', re.VERBOSE | re.DOTALL)
+
+# Preprocessor macros that expand to a behavior node named by their first argument
+DTSI_MACRO_CALL_COMPATIBLES = {
+    'ZMK_MACRO': 'zmk,behavior-macro',
+    'UNICODE': 'zmk,behavior-macro',
+}
+
+
+def _split_cells(cells: str) -> List[str]:
+    """Split the inside of <...> on whitespace, keeping LG(LA(X)) style groups together"""
+    params = []
+    current = []
+    depth = 0
+    for char in cells[1:-1]:
+        if depth == 0 and (char.isspace() or char == '&'):
+            # Like cpp, "LAYER_Symbol&macro_pause_for_release" is two tokens
+            if current:
+                params.append(''.join(current))
+                current = []
+            if char != '&':
+                continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        current.append(char)
+    if current:
+        params.append(''.join(current))
+    return params
+
+
+class DtsiNode:
+    """A devicetree node (or a ZMK_MACRO style call) with its labels and raw property values"""
+
+    def __init__(self, name: Optional[str], labels: List[str], call: Optional[str] = None):
+        self.name = name
+        self.labels = labels
+        self.call = call
+        self.properties = {}
+
+    @property
+    def compatible(self) -> Optional[str]:
+        values = self.properties.get('compatible')
+        if values:
+            return values[0].strip('"')
+        return DTSI_MACRO_CALL_COMPATIBLES.get(self.call)
+
+    @property
+    def bindings(self) -> List[Tuple[str, List[str]]]:
+        """(behavior, params) pairs, e.g. [('&kp', ['LG(F20)']), ('&mo', ['LAYER_Function'])]"""
+        bindings = []
+        for value in self.properties.get('bindings') or []:
+            if not value.startswith('<'):
+                continue
+            for param in _split_cells(value):
+                if param.startswith('&'):
+                    bindings.append((param, []))
+                elif bindings:
+                    bindings[-1][1].append(param)
+        return bindings
+
+
+class DtsiIndex:
+    """Node label → DtsiNode index built by one pass over a .dtsi file"""
+
+    def __init__(self, content: str):
+        self.nodes = []
+        self.labels = {}
+        self._parse(content)
+
+    def _add_node(self, node: DtsiNode):
+        self.nodes.append(node)
+        for label in node.labels:
+            self.labels[label] = node  # Later definitions win, like the #else branches below them
+
+    def _parse(self, content: str):
+        stack = []  # Open nodes, innermost last
+        pending = []  # Tokens of the statement being read
+        depth = 0  # Parentheses nesting inside a macro call
+
+        for match in _DTSI_TOKEN.finditer(content):
+            kind = match.lastgroup
+            if kind == 'end':
+                break
+            token = match.group(kind)
+            in_call = bool(stack) and stack[-1].call is not None
+
+            if kind != 'punct':
+                pending.append(token)
+            elif token == '{' and not in_call:
+                words = [t for t in pending if t != ':']
+                labels = [t for t, after in zip(pending, pending[1:]) if after == ':']
+                node = DtsiNode(words[-1] if words else None, labels)
+                self._add_node(node)
+                stack.append(node)
+                pending = []
+            elif token == '}' and not in_call:
+                if stack:
+                    stack.pop()
+                pending = []
+            elif token == ';':
+                if stack and pending:
+                    values = pending[2:] if pending[1:2] == ['='] else []
+                    stack[-1].properties[pending[0]] = [v for v in values if v != ',']
+                pending = []
+            elif token == '(':
+                if not in_call and len(pending) == 1:
+                    stack.append(DtsiNode(None, [], call=pending[0]))
+                    pending = []
+                else:
+                    depth += 1
+                    pending.append(token)
+            elif token == ',' and in_call and stack[-1].name is None and depth == 0:
+                node = stack[-1]
+                node.name = ''.join(pending)
+                node.labels = [node.name]
+                self._add_node(node)
+                pending = []
+            elif token == ')' and in_call and depth == 0:
+                stack.pop()
+                pending = []
+            else:
+                if token == ')':
+                    depth -= 1
+                pending.append(token)
+
+    def get(self, label: str) -> Optional[DtsiNode]:
+        return self.labels.get(label.lstrip('&'))
+
+    def with_compatible(self, compatible: str) -> List[DtsiNode]:
+        return [node for node in self.nodes if node.compatible == compatible]
 
-        # Pattern to match the macro behaviors and extract the key combination
-        macro_pattern = r'(\w+_with_[^:]+):\s*\1\s*\{[^}]*bindings\s*=\s*<[^>]*&kp\s+([^>]+)>'
-        macro_matches = re.findall(macro_pattern, content, re.MULTILINE | re.DOTALL)
 
-        # Create mapping from behavior name to trigger
-        behavior_to_trigger = {}
-        for behavior_name, trigger_combo in macro_matches:
-            trigger = trigger_combo.strip().rstrip(';').strip()
-            behavior_to_trigger[behavior_name] = trigger
+# Per-process cache of parsed DTSI indices: abspath → (stat signature, sha256, index)
+_dtsi_indexes: Dict[str, Tuple[Tuple[int, int], str, DtsiIndex]] = {}
 
-        # Find which thumb behaviors use which macros
-        thumb_pattern = r'thumb_(\w+):\s*thumb_\1\s*\{[^}]*bindings\s*=\s*<&([^,]+)>'
-        thumb_matches = re.findall(thumb_pattern, content, re.MULTILINE | re.DOTALL)
 
-        for layer_name, macro_behavior in thumb_matches:
-            if macro_behavior in behavior_to_trigger:
-                zmk_combo = behavior_to_trigger[macro_behavior]
-                readable_trigger = convert_zmk_combo_to_readable(zmk_combo)
-                triggers[layer_name.lower()] = readable_trigger
+def load_dtsi_index(filepath: str = "keymap.dtsi") -> DtsiIndex:
+    """Index a .dtsi file once per process; re-parse only when its content hash changes"""
+    import hashlib
+    path = os.path.abspath(filepath)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _dtsi_indexes.get(path)
+    if cached and cached[0] == signature:
+        return cached[2]
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if cached and cached[1] == digest:
+        index = cached[2]  # Touched but unchanged
+    else:
+        index = cached_parse('dtsi', path, digest, lambda: DtsiIndex(content.decode('utf-8')))
+    _dtsi_indexes[path] = (signature, digest, index)
+    return index
+
+
+def zmk_triggers_from_index(index: DtsiIndex) -> Dict[str, str]:
+    """Layer name (lowercase) → readable shortcut that announces the layer"""
+    triggers = {}
+
+    # Layer access hold-taps (thumb_*, space_*, ...) whose hold is a macro that
+    # announces the layer with a &kp shortcut before holding &mo LAYER_*
+    for hold_tap in index.with_compatible('zmk,behavior-hold-tap'):
+        hold_bindings = hold_tap.bindings
+        macro = index.get(hold_bindings[0][0]) if hold_bindings else None
+        if macro is None or macro.compatible != 'zmk,behavior-macro':
+            continue
+
+        macro_bindings = macro.bindings
+        layers = [params[0] for behavior, params in macro_bindings
+                  if behavior == '&mo' and params and params[0].startswith('LAYER_')]
+        shortcuts = [params for behavior, params in macro_bindings if behavior == '&kp' and params]
+        if layers and shortcuts:
+            zmk_combo = ' '.join(shortcuts[-1])
+            triggers[layers[0][len('LAYER_'):].lower()] = convert_zmk_combo_to_readable(zmk_combo)
+
+    return triggers
 
-        # Also look for space behaviors (for Symbol layer)
-        space_pattern = r'space_(\w+):\s*space_\1\s*\{[^}]*bindings\s*=\s*<&([^,]+)>'
-        space_matches = re.findall(space_pattern, content, re.MULTILINE | re.DOTALL)
 
-        for layer_name, macro_behavior in space_matches:
-            if macro_behavior in behavior_to_trigger:
-                zmk_combo = behavior_to_trigger[macro_behavior]
-                readable_trigger = convert_zmk_combo_to_readable(zmk_combo)
-                triggers[layer_name.lower()] = readable_trigger
+def parse_zmk_triggers(dtsi_filepath: str = "keymap.dtsi") -> Dict[str, str]:
+    """Parse actual ZMK trigger bindings from keymap.dtsi"""
+    triggers = {}
 
+    try:
+        triggers = zmk_triggers_from_index(load_dtsi_index(dtsi_filepath))
     except FileNotFoundError:
-        print(f"Warning: {dtsi_filepath} not found, no triggers will be available")
+        progress(f"Warning: {dtsi_filepath} not found, no triggers will be available")
     except Exception as e:
-        print(f"Warning: Error parsing {dtsi_filepath}: {e}, no triggers will be available")
+        progress(f"Warning: Error parsing {dtsi_filepath}: {e}, no triggers will be available")
 
     return triggers
 
@@ -897,65 +1459,185 @@ def convert_zmk_combo_to_readable(zmk_combo: str) -> str:
     return combo
 
 
-def format_compact_json(data):
-    """Format JSON with compact arrays for key rows"""
+# Keys whose rows are written one per line, e.g. [null, "Q", "W", "E", "R", "T"]
+COMPACT_ROW_KEYS = ('mainRows', 'thumbRows')
+
 
-    def format_json_with_compact_arrays(obj, indent=0):
+def write_compact_json(data, stream: TextIO):
+    """Stream JSON with compact arrays for key rows to a file handle, socket file or any text stream"""
+    write = stream.write
+
+    def dump(value) -> str:
+        return json.dumps(value, ensure_ascii=False)
+
+    def write_value(obj, indent=0):
         indent_str = "  " * indent
 
         if isinstance(obj, dict):
-            lines = ["{"]
-            items = list(obj.items())
-            for i, (key, value) in enumerate(items):
-                comma = "," if i < len(items) - 1 else ""
-                key_line = f'{indent_str}  "{key}": '
-
-                if key in ['mainRows', 'thumbRows'] and isinstance(value, list):
-                    # Format as compact arrays
-                    array_lines = ["["]
+            write("{")
+            last = len(obj) - 1
+            for i, (key, value) in enumerate(obj.items()):
+                comma = "," if i < last else ""
+                write(f'\n{indent_str}  "{key}": ')
+
+                if key in COMPACT_ROW_KEYS and isinstance(value, list):
+                    # Format as compact arrays, one row per line
+                    write("[")
+                    last_row = len(value) - 1
                     for j, row in enumerate(value):
-                        row_comma = "," if j < len(value) - 1 else ""
+                        row_comma = "," if j < last_row else ""
                         if isinstance(row, list):
-                            # Format row as single line
-                            row_items = []
-                            for item in row:
-                                if item is None:
-                                    row_items.append("null")
-                                else:
-                                    row_items.append(json.dumps(item, ensure_ascii=False))
-                            array_lines.append(f'{indent_str}    [{", ".join(row_items)}]{row_comma}')
+                            write(f'\n{indent_str}    [{", ".join(map(dump, row))}]{row_comma}')
                         else:
-                            array_lines.append(f'{indent_str}    {json.dumps(row, ensure_ascii=False)}{row_comma}')
-                    array_lines.append(f'{indent_str}  ]')
-                    value_str = '\n'.join(array_lines)
-                    lines.append(f'{key_line}{value_str}{comma}')
+                            write(f'\n{indent_str}    {dump(row)}{row_comma}')
+                    write(f'\n{indent_str}  ]{comma}')
+                elif isinstance(value, (dict, list)) and value:
+                    write_value(value, indent + 1)
+                    write(comma)
                 else:
-                    # Regular formatting
-                    if isinstance(value, (dict, list)) and value:
-                        value_str = format_json_with_compact_arrays(value, indent + 1)
-                        lines.append(f'{key_line}{value_str}{comma}')
-                    else:
-                        lines.append(f'{key_line}{json.dumps(value, ensure_ascii=False)}{comma}')
-            lines.append(f'{indent_str}}}')
-            return '\n'.join(lines)
-
+                    write(dump(value) + comma)
+            write(f'\n{indent_str}}}')
         elif isinstance(obj, list):
             if not obj:
-                return "[]"
-            lines = ["["]
+                write("[]")
+                return
+            write("[")
+            last = len(obj) - 1
             for i, item in enumerate(obj):
-                comma = "," if i < len(obj) - 1 else ""
+                write(f'\n{indent_str}  ')
                 if isinstance(item, (dict, list)):
-                    item_str = format_json_with_compact_arrays(item, indent + 1)
-                    lines.append(f'{indent_str}  {item_str}{comma}')
+                    write_value(item, indent + 1)
                 else:
-                    lines.append(f'{indent_str}  {json.dumps(item, ensure_ascii=False)}{comma}')
-            lines.append(f'{indent_str}]')
-            return '\n'.join(lines)
+                    write(dump(item))
+                if i < last:
+                    write(",")
+            write(f'\n{indent_str}]')
+        else:
+            write(dump(obj))
+
+    write_value(data)
+
+
+def format_compact_json(data) -> str:
+    """Format JSON with compact arrays for key rows"""
+    buffer = io.StringIO()
+    write_compact_json(data, buffer)
+    return buffer.getvalue()
+
+
+# Top-level keymap.json fields the converter reads: the layers, plus the
+# small binding lists that may also hold consumer codes
+KEYMAP_FIELDS = ('layer_names', 'layers', 'macros', 'holdTaps', 'combos')
+
+
+def _json_syntax(pattern: str, flags: int = 0) -> Dict[type, Any]:
+    """Compile a JSON syntax pattern for both raw bytes and decoded text"""
+    return {str: LazyPattern(pattern, flags), bytes: LazyPattern(pattern.encode(), flags)}
+
+
+_JSON_WHITESPACE = _json_syntax(r'[ \t\n\r]*')
+_JSON_STRING = _json_syntax(r'"[^"\\]*+(?:\\.[^"\\]*+)*+"', re.DOTALL)
+_JSON_SCALAR = _json_syntax(r'[^,:\]}\s]*')
+_JSON_UNTIL_STRUCTURE = _json_syntax(r'[^"\[\]{}]*+')
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _layers_decoder(interned: Dict[Binding, Binding]) -> json.JSONDecoder:
+    """Decodes keymap.json layers straight into Bindings (innermost params first)"""
+    return json.JSONDecoder(object_hook=lambda node: _lower_binding_node(node, interned))
+
+
+def _skip_json_whitespace(doc, pos: int) -> int:
+    return _JSON_WHITESPACE[type(doc)].match(doc, pos).end()
+
+
+def _skip_json_value(doc, pos: int) -> int:
+    """Return the end offset of the JSON value at pos without decoding it"""
+    first = doc[pos:pos + 1]
+    if first in ('"', b'"'):
+        match = _JSON_STRING[type(doc)].match(doc, pos)
+        if not match:
+            raise ValueError(f"Unterminated JSON string at offset {pos}")
+        return match.end()
+    if first not in ('{', '[', b'{', b'['):
+        return _JSON_SCALAR[type(doc)].match(doc, pos).end()
+
+    until_structure = _JSON_UNTIL_STRUCTURE[type(doc)]
+    depth = 0
+    while True:
+        pos = until_structure.match(doc, pos).end()
+        char = doc[pos:pos + 1]
+        if char in ('"', b'"'):
+            pos = _skip_json_value(doc, pos)
+        elif char in ('{', '[', b'{', b'['):
+            depth += 1
+            pos += 1
+        elif char in ('}', ']', b'}', b']'):
+            depth -= 1
+            pos += 1
+            if depth == 0:
+                return pos
         else:
-            return json.dumps(obj, ensure_ascii=False)
+            raise ValueError(f"Unterminated JSON container at offset {pos}")
+
+
+def load_keymap_fields(filepath: str = "keymap.json", fields=KEYMAP_FIELDS) -> Dict[str, Any]:
+    """Load only the requested top-level fields of a keymap JSON file.
+
+    Unwanted values (like the 350 KB custom_defined_behaviors string) are
+    skipped over as raw bytes, without being decoded into Python objects.
+    The text is only decoded from the first requested value onwards, and
+    layers are lowered to Bindings (see lower_layers). With the snapshot
+    cache enabled, an unchanged file is unpickled instead.
+    """
+    import hashlib
+    with open(filepath, 'rb') as f:
+        doc = f.read()
+    if snapshot_cache is None:
+        return parse_keymap_fields(doc, filepath, fields)
+    return snapshot_cache.load('keymap', filepath, hashlib.sha256(doc).hexdigest(),
+                               lambda: parse_keymap_fields(doc, filepath, fields), ','.join(fields))
+
+
+def parse_keymap_fields(doc: bytes, filepath: str = "keymap.json", fields=KEYMAP_FIELDS) -> Dict[str, Any]:
+    """load_keymap_fields() on a document already read into memory"""
+    wanted = set(fields)
+    result = {}
+    pos = _skip_json_whitespace(doc, 0)
+    if doc[pos:pos + 1] != b'{':
+        raise ValueError(f"{filepath}: expected a JSON object at offset {pos}")
+    pos = _skip_json_whitespace(doc, pos + 1)
+
+    while doc[pos:pos + 1] not in ('}', b'}') and wanted:
+        key_end = _skip_json_value(doc, pos)
+        key = json.loads(doc[pos:key_end])
+        pos = _skip_json_whitespace(doc, key_end)
+        if doc[pos:pos + 1] not in (':', b':'):
+            raise ValueError(f"{filepath}: expected ':' at offset {pos}")
+        pos = _skip_json_whitespace(doc, pos + 1)
+
+        if key in wanted:
+            if isinstance(doc, bytes):
+                # Switch to decoded text so the C decoder can parse in place
+                doc, pos = doc[pos:].decode('utf-8'), 0
+            if key == 'layers':
+                interned = {}  # Only this load's bindings, freed along with them
+                layers, pos = _layers_decoder(interned).raw_decode(doc, pos)
+                result[key] = lower_layers(layers, interned)
+            else:
+                result[key], pos = _JSON_DECODER.raw_decode(doc, pos)
+            wanted.discard(key)  # Stop as soon as every requested field is loaded
+        else:
+            pos = _skip_json_value(doc, pos)
+        pos = _skip_json_whitespace(doc, pos)
+
+        separator = doc[pos:pos + 1]
+        if separator in (',', b','):
+            pos = _skip_json_whitespace(doc, pos + 1)
+        elif separator not in ('}', b'}'):
+            raise ValueError(f"{filepath}: expected ',' or '}}' at offset {pos}")
 
-    return format_json_with_compact_arrays(data)
+    return result
 
 
 # Layer names to convert (hardcoded)
@@ -972,240 +1654,811 @@ LAYER_NAMES = [
 ]
 
 
-def parse_zmk_macro_definitions(dtsi_filepath: str = "keymap.dtsi.erb") -> Dict[str, str]:
-    """Parse actual ZMK macro definitions from ERB template to get real key combinations"""
+# C-preprocessor tokens for macro expansion and #if expressions
+_CPP_TOKEN = LazyPattern(r"""
+      (?P<space>\s+)
+    | (?P<number>\d+)[uUlL]*
+    | (?P<char>'(?:\\.|[^'\\])')
+    | (?P<ident>[A-Za-z_]\w*)
+    | (?P<op>&&|\|\||==|!=|<=|>=|<<|>>|.)
+""", re.VERBOSE | re.DOTALL)
+_CPP_DIRECTIVE = LazyPattern(r'\s*#\s*(\w+)\s*(.*)', re.DOTALL)
+_CPP_DEFINE = LazyPattern(r'([A-Za-z_]\w*)(?:\(([^)]*)\))?\s*(.*)', re.DOTALL)
+_CPP_DEFINED = LazyPattern(r'\bdefined\s*(?:\(\s*([A-Za-z_]\w*)\s*\)|([A-Za-z_]\w*))')
+_CPP_COMMENT = LazyPattern(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+
+# Binary operators of #if expressions by precedence (higher binds tighter)
+CPP_BINARY_OPERATORS = {
+    '||': (1, lambda a, b: int(bool(a) or bool(b))),
+    '&&': (2, lambda a, b: int(bool(a) and bool(b))),
+    '|': (3, lambda a, b: a | b),
+    '^': (4, lambda a, b: a ^ b),
+    '&': (5, lambda a, b: a & b),
+    '==': (6, lambda a, b: int(a == b)),
+    '!=': (6, lambda a, b: int(a != b)),
+    '<': (7, lambda a, b: int(a < b)),
+    '>': (7, lambda a, b: int(a > b)),
+    '<=': (7, lambda a, b: int(a <= b)),
+    '>=': (7, lambda a, b: int(a >= b)),
+    '<<': (8, lambda a, b: a << b),
+    '>>': (8, lambda a, b: a >> b),
+    '+': (9, lambda a, b: a + b),
+    '-': (9, lambda a, b: a - b),
+    '*': (10, lambda a, b: a * b),
+    '/': (10, lambda a, b: int(a / b)),
+    '%': (10, lambda a, b: a % b),
+}
+CPP_UNARY_OPERATORS = {
+    '!': lambda a: int(not a),
+    '-': lambda a: -a,
+    '+': lambda a: a,
+    '~': lambda a: ~a,
+}
+
+
+def evaluate_constant_expression(tokens: List[Tuple[str, str]]) -> int:
+    """Evaluate already-expanded C constant expression tokens; unknown identifiers are 0 like in cpp"""
+    position = 0
+
+    def peek() -> str:
+        return tokens[position][1] if position < len(tokens) else ''
+
+    def primary() -> int:
+        nonlocal position
+        if position == len(tokens):
+            raise ValueError("unexpected end of expression")
+        kind, token = tokens[position]
+        position += 1
+        if token in CPP_UNARY_OPERATORS and kind == 'op':
+            return CPP_UNARY_OPERATORS[token](primary())
+        if token == '(':
+            value = binary(0)
+            if peek() != ')':
+                raise ValueError(f"expected ')' but found {peek()!r}")
+            position += 1
+            return value
+        if kind == 'number':
+            return int(token.rstrip('uUlL'))
+        if kind == 'char':
+            return ord(token[1:-1].encode().decode('unicode_escape'))
+        if kind == 'ident':
+            return 0
+        raise ValueError(f"unexpected {token!r}")
+
+    def binary(min_precedence: int) -> int:
+        nonlocal position
+        value = primary()
+        while peek() in CPP_BINARY_OPERATORS:
+            precedence, apply = CPP_BINARY_OPERATORS[peek()]
+            if precedence <= min_precedence:
+                break
+            position += 1
+            value = apply(value, binary(precedence))
+        if min_precedence == 0 and peek() == '?':
+            position += 1
+            if_true = binary(0)
+            if peek() != ':':
+                raise ValueError("expected ':' in conditional expression")
+            position += 1
+            if_false = binary(0)
+            value = if_true if value else if_false
+        return value
+
+    value = binary(0)
+    if position != len(tokens):
+        raise ValueError(f"unexpected {tokens[position][1]!r}")
+    return value
+
+
+def _cpp_tokens(text: str) -> List[Tuple[str, str]]:
+    return [(match.lastgroup, match.group()) for match in _CPP_TOKEN.finditer(text) if match.lastgroup != 'space']
+
+
+class MacroTable:
+    """#define table of a C-preprocessed file with memoized macro expansion"""
+
+    def __init__(self, overrides: Optional[Dict[str, str]] = None):
+        self.objects = {}  # NAME → replacement text
+        self.functions = {}  # NAME → (parameters, replacement text)
+        self.locked = set()  # Names given on the "command line" that #define can't change
+        self._expansions = {}
+        for name, value in (overrides or {}).items():
+            self.define(name, None, value)
+        self.locked.update(overrides or {})
+
+    def define(self, name: str, parameters: Optional[List[str]], body: str):
+        if name in self.locked:
+            return
+        self.objects.pop(name, None)
+        self.functions.pop(name, None)
+        if parameters is None:
+            self.objects[name] = body.strip()
+        else:
+            self.functions[name] = (parameters, body.strip())
+        self._expansions.clear()
+
+    def undefine(self, name: str):
+        if name not in self.locked and (self.objects.pop(name, None) is not None
+                                        or self.functions.pop(name, None) is not None):
+            self._expansions.clear()
+
+    def is_defined(self, name: str) -> bool:
+        return name in self.objects or name in self.functions
+
+    def expand(self, text: str) -> str:
+        """Fully macro-expand text, e.g. "_C(LS(G))" → "LG(LS(G))" on macOS"""
+        expanded = self._expansions.get(text)
+        if expanded is None:
+            expanded = self._expansions[text] = self._expand(text, frozenset())
+        return expanded
+
+    def _expand(self, text: str, hidden: frozenset) -> str:
+        tokens = [match.group() for match in _CPP_TOKEN.finditer(text)]
+        output = []
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            i += 1
+            if token in hidden:
+                output.append(token)
+            elif token in self.objects:
+                output.append(self._expand(self.objects[token], hidden | {token}))
+            elif token in self.functions:
+                # Function-like macros only expand when followed by an argument list
+                j = i
+                while j < len(tokens) and tokens[j].isspace():
+                    j += 1
+                if j == len(tokens) or tokens[j] != '(':
+                    output.append(token)
+                    continue
+                arguments, i = self._collect_arguments(tokens, j + 1)
+                parameters, body = self.functions[token]
+                substitutions = {param: self._expand(arg, hidden) for param, arg in zip(parameters, arguments)}
+                if parameters and parameters[-1] == '...':
+                    substitutions['__VA_ARGS__'] = ','.join(arguments[len(parameters) - 1:])
+                replaced = ''.join(substitutions.get(t, t) for t in
+                                   (m.group() for m in _CPP_TOKEN.finditer(body)))
+                output.append(self._expand(replaced, hidden | {token}))
+            else:
+                output.append(token)
+        return ''.join(output)
+
+    @staticmethod
+    def _collect_arguments(tokens: List[str], i: int) -> Tuple[List[str], int]:
+        arguments = []
+        current = []
+        depth = 0
+        while i < len(tokens):
+            token = tokens[i]
+            i += 1
+            if token == ')' and depth == 0:
+                break
+            if token == ',' and depth == 0:
+                arguments.append(''.join(current).strip())
+                current = []
+                continue
+            if token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+            current.append(token)
+        arguments.append(''.join(current).strip())
+        return arguments, i
+
+    def evaluate(self, expression: str) -> int:
+        """Value of an #if/#elif expression"""
+        expression = _CPP_DEFINED.sub(
+            lambda m: '1' if self.is_defined(m.group(1) or m.group(2)) else '0', expression)
+        return evaluate_constant_expression(_cpp_tokens(self.expand(expression)))
+
+
+# ERB tags in keymap.dtsi.erb: <%= CONSTANTS[:key] %> lookups can be resolved, other tags can't
+_ERB_TAG = LazyPattern(r'<%(=?)(.*?)%>', re.DOTALL)
+_ERB_CONSTANT_HASH = LazyPattern(r'\b([A-Z_]+)\s*=\s*\{([^}]*)\}')
+_ERB_HASH_ENTRY = LazyPattern(r'(\w+):\s*"([^"]*)"')
+_ERB_CONSTANT_LOOKUP = LazyPattern(r'\s*([A-Z_]+)\[:(\w+)\]\s*')
+
+
+def strip_erb(content: str) -> str:
+    """Drop ERB code, resolving <%= HASH[:key] %> lookups of constant hashes defined in the template"""
+    constants = {}
+    for tag in _ERB_TAG.finditer(content):
+        for hash_match in _ERB_CONSTANT_HASH.finditer(tag.group(2)):
+            for key, value in _ERB_HASH_ENTRY.findall(hash_match.group(2)):
+                constants[(hash_match.group(1), key)] = value
+
+    def replace(tag):
+        lookup = _ERB_CONSTANT_LOOKUP.fullmatch(tag.group(2)) if tag.group(1) else None
+        return constants.get(lookup.groups(), '') if lookup else ''
+
+    return _ERB_TAG.sub(replace, content)
+
+
+def preprocess(content: str, overrides: Optional[Dict[str, str]] = None) -> Tuple[MacroTable, str]:
+    """Run the conditional and #define directives; returns the macro table and the active text"""
+    macros = MacroTable(overrides)
+    active_lines = []
+    # One frame per open #if: (parent active, this branch active, some branch already taken)
+    conditions = []
+    active = True
+
+    lines = _CPP_COMMENT.sub('', content.replace('\\\n', ' ')).split('\n')
+    for line in lines:
+        directive = _CPP_DIRECTIVE.fullmatch(line)
+        if directive is None:
+            if active:
+                active_lines.append(line)
+            continue
+
+        name, argument = directive.group(1), directive.group(2).strip()
+        if name in ('if', 'ifdef', 'ifndef'):
+            if not active:
+                taken = False
+            elif name == 'if':
+                taken = _evaluate_condition(macros, argument)
+            else:
+                taken = macros.is_defined(argument.split()[0] if argument else '') == (name == 'ifdef')
+            conditions.append((active, taken, taken))
+            active = active and taken
+        elif name in ('elif', 'else') and conditions:
+            parent, _, done = conditions[-1]
+            taken = not done and parent and (name == 'else' or _evaluate_condition(macros, argument))
+            conditions[-1] = (parent, taken, done or taken)
+            active = parent and taken
+        elif name == 'endif' and conditions:
+            active = conditions.pop()[0]
+        elif not active:
+            continue
+        elif name == 'define':
+            definition = _CPP_DEFINE.fullmatch(argument)
+            if definition:
+                parameters = definition.group(2)
+                if parameters is not None:
+                    parameters = [param.strip() for param in parameters.split(',') if param.strip()]
+                macros.define(definition.group(1), parameters, definition.group(3))
+        elif name == 'undef' and argument:
+            macros.undefine(argument.split()[0])
+
+    return macros, '\n'.join(active_lines)
+
+
+def _evaluate_condition(macros: MacroTable, expression: str) -> bool:
+    try:
+        return bool(macros.evaluate(expression))
+    except (ValueError, ZeroDivisionError):
+        return False  # Unrenderable ERB leftovers like "#if OPERATING_SYSTEM == "
+
+
+# Human-readable names of the OPERATING_SYSTEM settings
+OPERATING_SYSTEM_NAMES = {'L': 'Linux', 'M': 'macOS', 'W': 'Windows'}
+
+# Per-OS output suffixes → OPERATING_SYSTEM setting, e.g. split_matrix_config.linux.json
+OPERATING_SYSTEM_TARGETS = {'linux': 'L', 'macos': 'M', 'windows': 'W'}
+
+# Readable modifier names in output order, e.g. LS(LG(X)) → cmd+shift+x
+READABLE_MODIFIERS = {
+    'LG': 'cmd', 'RG': 'cmd',
+    'LA': 'alt', 'RA': 'alt',
+    'LC': 'ctrl', 'RC': 'ctrl',
+    'LS': 'shift', 'RS': 'shift',
+}
+READABLE_MODIFIER_ORDER = ('cmd', 'alt', 'ctrl', 'shift')
+
+# Editing shortcut #defines of keymap.dtsi.erb → macro mapping name
+EDITING_SHORTCUT_DEFINES = {
+    '_CUT': 'cut',
+    '_COPY': 'copy',
+    '_PASTE': 'paste',
+    '_UNDO': 'undo',
+    '_FIND': 'find',
+    '_REDO': 'redo',
+    '_FIND_NEXT': 'find_next',
+    '_FIND_PREV': 'find_prev',
+    '_LOCK': 'lock',
+}
+
+# Shortcuts for labels keymap.dtsi.erb doesn't (or can't) define, per OPERATING_SYSTEM.
+# Linux and Windows mirror the template's own _* macros (_C → LC, _HOME → HOME, Windows'
+# _LOCK → LG(L)); labels it binds to a bare keycode (_SLEEP, Linux's _LOCK) get none.
+OPERATING_SYSTEM_SHORTCUTS = {
+    'M': {
+        "Cut": "cmd+x", "Copy": "cmd+c", "Paste": "cmd+v", "Undo": "cmd+z", "Redo": "cmd+shift+z",
+        "Home": "cmd+up", "END": "cmd+down", "End": "cmd+down",
+        "🔍": "cmd+f", "🔍←": "cmd+shift+g", "🔍→": "cmd+g",
+        "😴": "cmd+alt+eject", "🔒": "cmd+ctrl+q", "📷": "cmd+shift+4",
+    },
+    'L': {
+        "Cut": "ctrl+x", "Copy": "ctrl+c", "Paste": "ctrl+v", "Undo": "ctrl+z", "Redo": "ctrl+y",
+        "Home": "home", "END": "end", "End": "end",
+        "🔍": "ctrl+f", "🔍←": "ctrl+shift+g", "🔍→": "ctrl+g",
+        "📷": "printscreen",
+    },
+    'W': {
+        "Cut": "ctrl+x", "Copy": "ctrl+c", "Paste": "ctrl+v", "Undo": "ctrl+z", "Redo": "ctrl+y",
+        "Home": "home", "END": "end", "End": "end",
+        "🔍": "ctrl+f", "🔍←": "ctrl+shift+g", "🔍→": "ctrl+g",
+        "🔒": "cmd+l", "📷": "printscreen",
+    },
+}
+
+# Selection behaviors → the ZMK_MACRO whose final keystroke is the action
+SELECTION_MACROS = {
+    'select_word': 'select_word_right',
+    'extend_word': 'extend_word_right',
+    'select_line': 'select_line_right',
+    'extend_line': 'extend_line_right',
+    'select_none': 'select_none',
+}
+
+
+def readable_key_combo(expanded: str) -> Optional[str]:
+    """Turn an expanded ZMK keycode like LG(LS(G)) into cmd+shift+g; None if it isn't a key combo"""
+    modifiers = set()
+    combo = expanded.replace(' ', '')
+    while '(' in combo and combo.endswith(')'):
+        modifier, combo = combo[:-1].split('(', 1)
+        if modifier not in READABLE_MODIFIERS:
+            return None
+        modifiers.add(READABLE_MODIFIERS[modifier])
+    # K_LOCK, C_SLEEP and the like are keycodes only the host understands, not key combos
+    if not re.fullmatch(r'\w+', combo) or combo.startswith(('K_', 'C_')):
+        return None
+    return '+'.join([mod for mod in READABLE_MODIFIER_ORDER if mod in modifiers] + [combo.lower()])
+
+
+def preprocess_macro_template(content: str, operating_system: Optional[str] = None) -> Tuple[MacroTable, DtsiIndex]:
+    """keymap.dtsi.erb text → its macro table and the behaviors of the active branches"""
+    overrides = {'OPERATING_SYSTEM': f"'{operating_system}'"} if operating_system else None
+    macros, active_text = preprocess(strip_erb(content), overrides)
+    return macros, DtsiIndex(active_text)
+
+
+def zmk_macro_mappings(macros: MacroTable, behaviors: DtsiIndex) -> Dict[str, str]:
+    """Editing shortcut (select_word, cut, ...) → readable key combo, from a preprocessed keymap.dtsi.erb
+
+    The 'operating_system' entry is the template's effective OPERATING_SYSTEM ('L', 'M' or 'W').
+    """
+    macro_mappings = {'operating_system': chr(macros.evaluate('OPERATING_SYSTEM') or ord('L'))}
+
+    # Selection macros act like their final keystroke, e.g. select_word_right ends on _WORD(LS(RIGHT))
+    for name, macro_name in SELECTION_MACROS.items():
+        macro = behaviors.get(macro_name)
+        keystrokes = [params for behavior, params in macro.bindings if behavior == '&kp' and params] if macro else []
+        combo = readable_key_combo(macros.expand(keystrokes[-1][0])) if keystrokes else None
+        if combo:
+            macro_mappings[name] = combo
+
+    # select_all is a plain "#define select_all kp _C(A)" behavior alias
+    select_all = macros.objects.get('select_all', '').split()
+    if select_all[:1] == ['kp'] and len(select_all) == 2:
+        combo = readable_key_combo(macros.expand(select_all[1]))
+        if combo:
+            macro_mappings['select_all'] = combo
+
+    for define_name, name in EDITING_SHORTCUT_DEFINES.items():
+        if macros.is_defined(define_name):
+            combo = readable_key_combo(macros.expand(define_name))
+            if combo:
+                macro_mappings[name] = combo
+
+    return macro_mappings
+
+
+def parse_zmk_macro_definitions(dtsi_filepath: str = "keymap.dtsi.erb",
+                                operating_system: Optional[str] = None) -> Dict[str, str]:
+    """Parse actual ZMK macro definitions from ERB template to get real key combinations
+
+    operating_system ('L', 'M' or 'W') overrides the template's own OPERATING_SYSTEM setting.
+    """
+    import hashlib
     macro_mappings = {}
 
     try:
-        with open(dtsi_filepath, 'r', encoding='utf-8') as f:
+        with open(dtsi_filepath, 'rb') as f:
             content = f.read()
 
-        # First, extract OS-specific macro definitions for _WORD, _HOME, _END
-        os_macros = {}
+        macros, behaviors = cached_parse('macros', dtsi_filepath, hashlib.sha256(content).hexdigest(),
+                                         lambda: preprocess_macro_template(content.decode('utf-8'), operating_system),
+                                         operating_system or '')
+        macro_mappings = zmk_macro_mappings(macros, behaviors)
+        shortcuts = sorted(item for item in macro_mappings.items() if item[0] != 'operating_system')
+        os_code = macro_mappings['operating_system']
 
-        # Check which OS mode is active by looking for the actual setting
-        os_pattern = r"#define\s+OPERATING_SYSTEM\s+'([LMW])'"
-        os_match = re.search(os_pattern, content)
-        is_macos = os_match and os_match.group(1) == 'M'
+        progress(f"🔍 Detected {OPERATING_SYSTEM_NAMES.get(os_code, os_code)} mode")
+        progress(f"  _WORD → {macros.expand('_WORD')}, _HOME → {macros.expand('_HOME')}, _END → {macros.expand('_END')}")
 
-        if is_macos:
-            # macOS definitions
-            os_macros['_WORD'] = 'LA'      # Alt key
-            os_macros['_HOME'] = 'LG(LEFT)'  # Cmd+Left
-            os_macros['_END'] = 'LG(RIGHT)'  # Cmd+Right
-            os_macros['_C'] = 'LG'          # Cmd key
-        else:
-            # Linux/Windows definitions
-            os_macros['_WORD'] = 'LC'      # Ctrl key
-            os_macros['_HOME'] = 'HOME'    # Home key
-            os_macros['_END'] = 'END'      # End key
-            os_macros['_C'] = 'LC'         # Ctrl key
-
-        print(f"🔍 Detected {'macOS' if is_macos else 'Linux/Windows'} mode")
-        print(f"  _WORD → {os_macros['_WORD']}, _HOME → {os_macros['_HOME']}, _END → {os_macros['_END']}")
-
-        # Parse the actual ZMK_MACRO definitions for select/extend behaviors
-        # These contain the real key sequences, not simplified versions
-
-        # Parse select_word_right and select_word_left
-        select_word_pattern = r'ZMK_MACRO\(select_word_right,.*?bindings\s*=\s*<([^>]+)>'
-        select_word_match = re.search(select_word_pattern, content, re.DOTALL)
-        if select_word_match:
-            bindings = select_word_match.group(1)
-            # Extract the key sequence (usually _WORD(RIGHT) with LS modifier)
-            if 'LS(_WORD(RIGHT))' in bindings or 'LS' in bindings and '_WORD' in bindings:
-                macro_mappings['select_word'] = 'alt+shift+right' if is_macos else 'ctrl+shift+right'
-            else:
-                # Fallback to basic word selection
-                macro_mappings['select_word'] = 'alt+shift+right' if is_macos else 'ctrl+shift+right'
-
-        # Parse extend_word behaviors
-        extend_word_pattern = r'ZMK_MACRO\(extend_word_right,.*?bindings\s*=\s*<([^>]+)>'
-        extend_word_match = re.search(extend_word_pattern, content, re.DOTALL)
-        if extend_word_match:
-            bindings = extend_word_match.group(1)
-            if 'LS(_WORD(RIGHT))' in bindings or 'LS' in bindings and '_WORD' in bindings:
-                macro_mappings['extend_word'] = 'alt+shift+right' if is_macos else 'ctrl+shift+right'
-
-        # Parse select_line behaviors - looking for actual key sequences
-        select_line_pattern = r'ZMK_MACRO\(select_line_right,.*?bindings\s*=\s*<([^>]+)>'
-        select_line_match = re.search(select_line_pattern, content, re.DOTALL)
-        if select_line_match:
-            bindings = select_line_match.group(1)
-            # macOS: Cmd+Shift+Right to select to end of line
-            # Linux/Windows: Shift+End
-            if is_macos:
-                if '_HOME' in bindings and 'LS(_END)' in bindings:
-                    # Move to start of line, then shift+select to end
-                    macro_mappings['select_line'] = 'cmd+shift+right'
-                else:
-                    macro_mappings['select_line'] = 'cmd+shift+right'
-            else:
-                macro_mappings['select_line'] = 'shift+end'
-
-        # Parse extend_line behaviors
-        extend_line_pattern = r'ZMK_MACRO\(extend_line_right,.*?bindings\s*=\s*<([^>]+)>'
-        extend_line_match = re.search(extend_line_pattern, content, re.DOTALL)
-        if extend_line_match:
-            bindings = extend_line_match.group(1)
-            if is_macos:
-                # Extend selection by line
-                macro_mappings['extend_line'] = 'shift+cmd+right'
-            else:
-                macro_mappings['extend_line'] = 'shift+end'
-
-        # Parse select_all - simple #define
-        select_all_pattern = r'#define\s+select_all\s+kp\s+_C\(A\)'
-        if re.search(select_all_pattern, content):
-            macro_mappings['select_all'] = 'cmd+a' if is_macos else 'ctrl+a'
-
-        # Parse select_none (clear selection)
-        select_none_pattern = r'ZMK_MACRO\(select_none,.*?bindings\s*=\s*<([^>]+)>'
-        select_none_match = re.search(select_none_pattern, content, re.DOTALL)
-        if select_none_match:
-            bindings = select_none_match.group(1)
-            if 'ESC' in bindings or 'ESCAPE' in bindings:
-                macro_mappings['select_none'] = 'escape'
-            elif 'LEFT' in bindings:
-                macro_mappings['select_none'] = 'left'  # Move cursor to deselect
-            else:
-                macro_mappings['select_none'] = 'escape'
-
-        # Add standard editing operations that use _C macro
-        standard_ops = {
-            '_CUT': 'x',
-            '_COPY': 'c',
-            '_PASTE': 'v',
-            '_UNDO': 'z',
-            '_FIND': 'f',
+        progress(f"🔍 Parsed ZMK macro definitions: {len(shortcuts)} macros found")
+        for name, combo in shortcuts[:15]:  # Show first 15
+            progress(f"  {name} → {combo}")
+
+    except Exception as e:
+        progress(f"Warning: Could not parse ZMK macros from {dtsi_filepath}: {e}")
+
+    return macro_mappings
+
+
+# Standard ZMK behaviors; anything else starting with & is a custom behavior
+STANDARD_BEHAVIORS = (
+    '&kp', '&mt', '&mo', '&tog', '&sk', '&trans', '&none',
+    '&lt', '&td', '&rgb_ug', '&ext_power', '&out', '&bt',
+    '&mkp', '&mmv', '&msc', '&mwh', '&caps_word', '&key_repeat'
+)
+
+# Generated display names containing these need action mappings
+ACTION_KEYWORDS = [
+    'Sel ', 'Ext ', 'Clear',  # Selection
+    'Cut', 'Copy', 'Paste', 'Undo', 'Redo',  # Editing
+    '⌘', '⌥', '⌃', '⇧',  # Modifier keys
+    '🔍', '🔒',  # Special actions
+    'Home', 'End', 'PgUp', 'PgDn',  # Navigation
+    '☀', '🔊', '🔉', '🔇',  # Media controls
+    'Scroll', 'Click', 'Btn',  # Mouse
+    'Layer', 'Toggle', 'MAGIC'  # Layer controls
+]
+
+
+class ConversionCache:
+    """Memoized convert_zmk_key results keyed by binding and overlay class"""
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, key_data: Binding, layer_name: str = '') -> Optional[str]:
+        key = (key_data, is_overlay_layer(layer_name))
+        if key in self.entries:
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        result = self.entries[key] = convert_zmk_key(key_data, layer_name)
+        return result
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.entries),
+            'hitRate': self.hits / lookups if lookups else 0.0,
         }
 
-        for op_name, key in standard_ops.items():
-            pattern = rf'#define\s+{op_name}\s+_C\({key.upper()}\)'
-            if re.search(pattern, content, re.IGNORECASE):
-                prefix = 'cmd' if is_macos else 'ctrl'
-                macro_mappings[op_name.lstrip('_').lower()] = f'{prefix}+{key}'
 
-        # Parse _REDO which is OS-specific
-        if is_macos:
-            if re.search(r'#define\s+_REDO\s+LG\(LS\(Z\)\)', content):
-                macro_mappings['redo'] = 'cmd+shift+z'
-        else:
-            if re.search(r'#define\s+_REDO\s+LC\(Y\)', content):
-                macro_mappings['redo'] = 'ctrl+y'
+# Shared across every keymap converted in this process
+conversion_cache = ConversionCache()
 
-        # Also handle _FIND_NEXT and _FIND_PREV
-        if re.search(r'#define\s+_FIND_NEXT\s+_C\(G\)', content):
-            macro_mappings['find_next'] = 'cmd+g' if is_macos else 'ctrl+g'
-        if re.search(r'#define\s+_FIND_PREV\s+_C\(LS\(G\)\)', content):
-            macro_mappings['find_prev'] = 'cmd+shift+g' if is_macos else 'ctrl+shift+g'
 
-        print(f"🔍 Parsed ZMK macro definitions: {len(macro_mappings)} macros found")
-        for name, combo in sorted(macro_mappings.items())[:15]:  # Show first 15
-            print(f"  {name} → {combo}")
+class KeymapScan:
+    """Everything later stages need from keymap.json, gathered in one pass over the layers"""
 
-    except Exception as e:
-        print(f"Warning: Could not parse ZMK macros from {dtsi_filepath}: {e}")
+    def __init__(self):
+        self.custom_behaviors = set()
+        self.display_names = set()
+        self.consumer_codes = {}  # Ordered set, in the order codes are first seen
+        self.converted_layers = []  # Per layer: converted label for each key position
 
-    return macro_mappings
+    def add_layer(self, record: Dict[str, List[Any]]):
+        """Merge one layer's scan_layer() record"""
+        self.custom_behaviors.update(record['customBehaviors'])
+        self.display_names.update(record['displayNames'])
+        self.consumer_codes.update(dict.fromkeys(record['consumerCodes']))
+        self.converted_layers.append(record['labels'])
 
 
-def find_custom_behaviors_in_keymap(data):
-    """Scan keymap.json to find all custom behaviors used in layers"""
-    custom_behaviors = set()
+def _scan_consumer_codes(obj, consumer_codes: Dict[str, None]):
+    """Recursively scan for consumer codes in keymap behaviors"""
+    if isinstance(obj, dict):
+        value = obj.get('value')
+        if isinstance(value, str) and value.startswith('C_'):
+            consumer_codes[value] = None
+        for v in obj.values():
+            _scan_consumer_codes(v, consumer_codes)
+    elif isinstance(obj, list):
+        for item in obj:
+            _scan_consumer_codes(item, consumer_codes)
 
-    def scan_value(obj):
-        """Recursively scan for custom behaviors"""
-        if isinstance(obj, dict):
-            value = obj.get('value', '')
-            if isinstance(value, str) and value.startswith('&'):
-                # Check for standard ZMK behaviors vs custom ones
-                standard_behaviors = [
-                    '&kp', '&mt', '&mo', '&tog', '&sk', '&trans', '&none',
-                    '&lt', '&td', '&rgb_ug', '&ext_power', '&out', '&bt',
-                    '&mkp', '&mmv', '&msc', '&mwh', '&caps_word', '&key_repeat'
-                ]
-                if not any(value.startswith(std) for std in standard_behaviors):
-                    # This is a custom behavior
-                    behavior_name = value.split()[0][1:]  # Remove & prefix and get first word
-                    custom_behaviors.add(behavior_name)
-            # Recurse into params
-            params = obj.get('params', [])
-            if params:
-                for param in params:
-                    scan_value(param)
-        elif isinstance(obj, list):
+
+def scan_layer(layer_data: Tuple[Any, ...], layer_name: str, cache: Optional[ConversionCache] = None) -> Dict[str, List[Any]]:
+    """Visit every key of one layer: custom behaviors, consumer codes and converted labels"""
+    if cache is None:
+        cache = conversion_cache
+    custom_behaviors = set()
+    display_names = set()
+    consumer_codes = {}
+
+    def visit_binding(obj):
+        if isinstance(obj, Binding):
+            value = obj.value
+            if isinstance(value, str):
+                if value.startswith('&'):
+                    if not value.startswith(STANDARD_BEHAVIORS):
+                        # Remove & prefix and get first word
+                        custom_behaviors.add(value.split()[0][1:])
+                elif value.startswith('C_'):
+                    consumer_codes[value] = None
+            for param in obj.params:
+                visit_binding(param)
+        elif isinstance(obj, tuple):
             for item in obj:
-                scan_value(item)
+                visit_binding(item)
         elif isinstance(obj, str) and obj.startswith('&'):
             # Direct string reference to behavior
-            behavior_name = obj.split()[0][1:]
-            custom_behaviors.add(behavior_name)
-
-    # Scan all layers
-    layers = data.get('layers', [])
-    for layer in layers:
-        for key_data in layer:
-            scan_value(key_data)
-
-    return custom_behaviors
+            custom_behaviors.add(obj.split()[0][1:])
+
+    labels = []
+    for key_data in layer_data:
+        visit_binding(key_data)
+        display_name = None
+        if isinstance(key_data, Binding):
+            display_name = cache.convert(key_data, layer_name)
+            if display_name and isinstance(display_name, str):
+                if any(keyword in display_name for keyword in ACTION_KEYWORDS):
+                    display_names.add(display_name)
+        labels.append(display_name)
+
+    return {
+        'labels': labels,
+        'customBehaviors': sorted(custom_behaviors),
+        'displayNames': sorted(display_names),
+        'consumerCodes': list(consumer_codes),
+    }
 
 
-def scan_generated_display_names(data):
-    """Scan all layers for generated display names (like 'Sel All', 'Ext Word') to find what needs action mappings"""
-    display_names = set()
+def scan_keymap(data, cache: Optional[ConversionCache] = None, build_cache: Optional['BuildCache'] = None,
+                shared_records: Optional[Dict[Tuple[int, str], Tuple[Tuple[Any, ...], Dict[str, List[Any]]]]] = None) -> KeymapScan:
+    """Visit every key of every layer once, reusing unchanged layers from the build cache.
 
-    # Convert each layer to see what display names are generated
-    layers = data.get('layers', [])
+    shared_records memoizes layer records by layer object identity, for
+    keymaps that share their layer lists (see overlay_base_layer).
+    """
+    scan = KeymapScan()
+    layers = lower_layers(data.get('layers', ()))  # No-op unless given json.load() output
     layer_names_list = data.get('layer_names', [])
 
     for i, layer_data in enumerate(layers):
         layer_name = layer_names_list[i] if i < len(layer_names_list) else f"Layer_{i}"
+        with profile_stage(f'layer {i}: {layer_name}'):
+            if shared_records is not None:
+                # The layer itself is kept alongside its record, so its id can't be reused
+                shared_layer, record = shared_records.get((id(layer_data), layer_name), (None, None))
+                if shared_layer is not layer_data:
+                    record = scan_layer(layer_data, layer_name, cache)
+                    shared_records[id(layer_data), layer_name] = (layer_data, record)
+                scan.add_layer(record)
+            elif build_cache is None:
+                scan.add_layer(scan_layer(layer_data, layer_name, cache))
+            else:
+                scan.add_layer(build_cache.layer_record(
+                    layer_data, layer_name, lambda: scan_layer(layer_data, layer_name, cache)))
+
+    # Consumer codes may also be bound outside the layers (macros, combos, ...)
+    for field, value in data.items():
+        if field != 'layers' and isinstance(value, (dict, list)):
+            _scan_consumer_codes(value, scan.consumer_codes)
+
+    return scan
+
+
+# Files besides the keymap itself that feed into the generated config
+CONVERTER_INPUTS = ('keymap.dtsi', 'keymap.dtsi.erb', 'emoji.yaml', 'world.yaml')
+BUILD_CACHE_VERSION = 2
+
 
-        for key_data in layer_data:
-            if isinstance(key_data, dict):
-                display_name = convert_zmk_key(key_data, layer_name)
-                if display_name and isinstance(display_name, str):
-                    # Look for actions that need mappings
-                    action_keywords = [
-                        'Sel ', 'Ext ', 'Clear',  # Selection
-                        'Cut', 'Copy', 'Paste', 'Undo', 'Redo',  # Editing
-                        '⌘', '⌥', '⌃', '⇧',  # Modifier keys
-                        '🔍', '🔒',  # Special actions
-                        'Home', 'End', 'PgUp', 'PgDn',  # Navigation
-                        '☀', '🔊', '🔉', '🔇',  # Media controls
-                        'Scroll', 'Click', 'Btn',  # Mouse
-                        'Layer', 'Toggle', 'MAGIC'  # Layer controls
-                    ]
-                    if any(keyword in display_name for keyword in action_keywords):
-                        display_names.add(display_name)
-
-    return display_names
-
-
-def extract_action_mappings_from_keymap(data):
-    """Extract actual key mappings from ZMK keymap data to generate proper actionMappings"""
+def converter_inputs(keymap_path: str, layout_path: Optional[str] = None) -> List[str]:
+    """Every file a conversion of keymap_path reads"""
+    return [keymap_path, *CONVERTER_INPUTS, *([layout_path] if layout_path else [])]
+
+
+def file_sha256(filepath: str) -> Optional[str]:
+    """Content hash of a file, or None if it doesn't exist"""
+    import hashlib
+    try:
+        with open(filepath, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def build_cache_path(output_path: str) -> str:
+    """split_matrix_config.json → .split_matrix_config.json.cache next to it"""
+    directory, name = os.path.split(output_path)
+    return os.path.join(directory, f'.{name}.cache')
+
+
+class BuildCache:
+    """Content-hash cache of inputs and per-layer scan results for incremental rebuilds"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.converter_hash = file_sha256(os.path.abspath(__file__))
+        self.input_hashes = {}
+        self.reused_layers = 0
+        self.converted_layers = 0
+        self._used_layers = {}
+
+        self.entries = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            if entries.get('version') == BUILD_CACHE_VERSION and entries.get('converter') == self.converter_hash:
+                self.entries = entries
+        except (FileNotFoundError, ValueError):
+            pass  # Missing or corrupt cache: rebuild everything
+
+    def hash_inputs(self, filepaths: List[str]) -> Dict[str, Optional[str]]:
+        """Start a build: hash the inputs and reset the per-build layer stats"""
+        self.input_hashes = {path: file_sha256(path) for path in filepaths}
+        self.reused_layers = 0
+        self.converted_layers = 0
+        self._used_layers = {}
+        return self.input_hashes
+
+    def is_up_to_date(self, *output_paths: str) -> bool:
+        """True when no input changed since the last build and its outputs are untouched"""
+        return (bool(self.entries)
+                and self.entries.get('inputs') == self.input_hashes
+                and self.entries.get('outputs') == {path: file_sha256(path) for path in output_paths})
+
+    def memo(self, name: str, input_path: str, compute: Callable[[], Any]) -> Any:
+        """Reuse a cached result derived from a single input file, keyed by its content hash"""
+        input_hash = self.input_hashes.get(input_path)
+        cached = self.entries.get('derived', {}).get(name)
+        if cached and cached['input'] == input_hash:
+            result = cached['result']
+        else:
+            result = compute()
+        self.entries.setdefault('derived', {})[name] = {'input': input_hash, 'result': result}
+        return result
+
+    def layer_record(self, layer_data: Tuple[Any, ...], layer_name: str, compute: Callable[[], Dict[str, List[Any]]]) -> Dict[str, List[Any]]:
+        """Reuse a layer's scan record unless its bindings, overlay class or character data changed"""
+        import hashlib
+        bindings = json.dumps(layer_data, sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha256(bindings.encode('utf-8'))
+        digest.update(b'overlay' if is_overlay_layer(layer_name) else b'base')
+        for behavior_prefix, character_file in (('&emoji_', 'emoji.yaml'), ('&world_', 'world.yaml')):
+            if behavior_prefix in bindings:
+                digest.update(str(self.input_hashes.get(character_file)).encode('utf-8'))
+        key = digest.hexdigest()
+
+        record = self.entries.get('layers', {}).get(key)
+        if record is None:
+            record = compute()
+            self.converted_layers += 1
+        else:
+            self.reused_layers += 1
+        self._used_layers[key] = record
+        return record
+
+    def save(self, *output_paths: str):
+        """Record this build; layer records that weren't used are dropped"""
+        self.entries.update({
+            'version': BUILD_CACHE_VERSION,
+            'converter': self.converter_hash,
+            'inputs': self.input_hashes,
+            'outputs': {path: file_sha256(path) for path in output_paths},
+            'layers': self._used_layers,
+        })
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+SNAPSHOT_CACHE_DIR = '.split_matrix_cache'
+
+
+class SnapshotCache:
+    """Pickled parse results (keymap fields, DTSI index, macro table, character tables) on disk.
+
+    Entries are keyed by the input's content hash and the converter's own hash,
+    so a warm run unpickles instead of parsing. Each input (and variant) keeps a
+    single entry: storing a new one evicts the stale one it replaces.
+    """
+
+    def __init__(self, directory: str = SNAPSHOT_CACHE_DIR):
+        self.directory = directory
+        self.converter_hash = file_sha256(os.path.abspath(__file__))
+        self.hits = 0
+        self.misses = 0
+        import pickle
+        self._pickle = pickle
+
+    def _entry_prefix(self, kind: str, source: str, variant: str) -> str:
+        # Pickles name their classes by module, so __main__ and imported runs keep separate entries
+        import hashlib
+        slot = f'{os.path.abspath(source)}\0{variant}\0{__name__}'
+        return f'{kind}-{hashlib.sha256(slot.encode("utf-8")).hexdigest()[:16]}-'
+
+    def load(self, kind: str, source: str, digest: str, parse: Callable[[], Any], variant: str = '') -> Any:
+        """Unpickle the entry for this content of source, or parse() it and store the result"""
+        import hashlib
+        prefix = self._entry_prefix(kind, source, variant)
+        key = hashlib.sha256(f'{self.converter_hash}\0{digest}'.encode('utf-8')).hexdigest()[:32]
+        path = os.path.join(self.directory, f'{prefix}{key}.pickle')
+        try:
+            with open(path, 'rb') as f:
+                value = self._pickle.load(f)
+            self.hits += 1
+            return value
+        except Exception:
+            pass  # Missing, truncated or otherwise unreadable entry: parse and overwrite it
+
+        self.misses += 1
+        value = parse()
+        self._store(prefix, path, value)
+        return value
+
+    def _store(self, prefix: str, path: str, value: Any):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                self._pickle.dump(value, f, protocol=self._pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            for name in os.listdir(self.directory):
+                stale = os.path.join(self.directory, name)
+                if name.startswith(prefix) and name.endswith('.pickle') and stale != path:
+                    os.unlink(stale)
+        except OSError:
+            pass  # The cache is only an optimization; a read-only checkout still converts fine
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+# Set by enable_snapshot_cache(); library callers parse from scratch unless they opt in
+snapshot_cache: Optional[SnapshotCache] = None
+
+
+def enable_snapshot_cache(directory: str = SNAPSHOT_CACHE_DIR) -> SnapshotCache:
+    global snapshot_cache
+    if snapshot_cache is None or snapshot_cache.directory != directory:
+        snapshot_cache = SnapshotCache(directory)
+    return snapshot_cache
+
+
+def cached_parse(kind: str, source: str, digest: str, parse: Callable[[], Any], variant: str = '') -> Any:
+    """parse(), served from the snapshot cache when it is enabled"""
+    if snapshot_cache is None:
+        return parse()
+    return snapshot_cache.load(kind, source, digest, parse, variant)
+
+
+def extract_action_mappings_from_keymap(data, scan: Optional[KeymapScan] = None, zmk_macros: Optional[Dict[str, str]] = None,
+                                        operating_system: Optional[str] = None):
+    """Extract actual key mappings from ZMK keymap data to generate proper actionMappings
+
+    operating_system ('L', 'M' or 'W') picks the fallback shortcuts; by default
+    it is the one zmk_macros was parsed for, or macOS without a template.
+    """
     mappings = {}
+    if scan is None:
+        scan = scan_keymap(data)
 
-    # Step 1: Find all custom behaviors used in the keymap layers
-    custom_behaviors = find_custom_behaviors_in_keymap(data)
+    # Step 1: Custom behaviors used in the keymap layers
+    custom_behaviors = scan.custom_behaviors
     if len(custom_behaviors) > 0:
-        print(f"🔍 Found {len(custom_behaviors)} custom behaviors in keymap")
+        progress(f"🔍 Found {len(custom_behaviors)} custom behaviors in keymap")
         # Don't print all behaviors as it's too verbose
-    print()
+    progress()
 
-    # Step 2: Find all generated display names that need action mappings
-    display_names = scan_generated_display_names(data)
+    # Step 2: Generated display names that need action mappings
+    display_names = scan.display_names
     if len(display_names) > 0:
-        print(f"🔍 Found {len(display_names)} generated display names that may need action mappings")
+        progress(f"🔍 Found {len(display_names)} generated display names that may need action mappings")
         # Only print the most relevant ones
         relevant_names = [n for n in display_names if any(k in n for k in ['Sel ', 'Ext ', 'Clear', 'Cut', 'Copy', 'Paste', 'Undo', 'Redo'])]
         if relevant_names:
-            print(f"  Key editing actions found: {', '.join(sorted(relevant_names)[:10])}")
-    print()
+            progress(f"  Key editing actions found: {', '.join(sorted(relevant_names)[:10])}")
+    progress()
 
     # Step 3: Parse ZMK macro definitions from keymap.dtsi.erb
-    zmk_macros = parse_zmk_macro_definitions()
+    if zmk_macros is None:
+        zmk_macros = parse_zmk_macro_definitions()
 
     # Step 4: Create mappings for text selection/editing behaviors
     behavior_to_display_mappings = {
@@ -1221,27 +2474,24 @@ def extract_action_mappings_from_keymap(data):
         "undo": "Undo",
         "redo": "Redo",
         "find": "🔍",
+        "find_next": "🔍→",
+        "find_prev": "🔍←",
+        "lock": "🔒",
     }
 
     # Map behaviors to display names using parsed ZMK macros
     for zmk_name, display_name in behavior_to_display_mappings.items():
         if zmk_name in zmk_macros:
             mappings[display_name] = zmk_macros[zmk_name]
-            print(f"✅ Mapped {display_name} → {zmk_macros[zmk_name]} (from ZMK macro)")
+            progress(f"✅ Mapped {display_name} → {zmk_macros[zmk_name]} (from ZMK macro)")
         elif display_name in display_names:
-            print(f"⚠️  Found display name '{display_name}' but no ZMK macro '{zmk_name}'")
+            progress(f"⚠️  Found display name '{display_name}' but no ZMK macro '{zmk_name}'")
 
     # Standard text editing operations (add if not already mapped)
     # These are fallbacks for when ZMK macros aren't found
+    operating_system = operating_system or zmk_macros.get('operating_system', 'M')
     standard_mappings = {
-        "Cut": zmk_macros.get('cut', 'cmd+x'),
-        "Copy": zmk_macros.get('copy', 'cmd+c'),
-        "Paste": zmk_macros.get('paste', 'cmd+v'),
-        "Undo": zmk_macros.get('undo', 'cmd+z'),
-        "Redo": zmk_macros.get('redo', 'cmd+shift+z'),
-        "Home": "cmd+up",
-        "END": "cmd+down",
-        "End": "cmd+down",
+        **OPERATING_SYSTEM_SHORTCUTS[operating_system],
         "PgUp": "pageup",
         "PgDn": "pagedown",
         "Insert": "insert",
@@ -1257,9 +2507,6 @@ def extract_action_mappings_from_keymap(data):
         "→": "right",
         "↑": "up",
         "↓": "down",
-        "🔍": "cmd+f",
-        "🔍←": "cmd+g",
-        "🔍→": "cmd+shift+g",
         "⌃": "ctrl",
         "⌥": "alt",
         "⌘": "cmd",
@@ -1275,13 +2522,11 @@ def extract_action_mappings_from_keymap(data):
         "⇳": "f14",
         "NumLock": "f6",
         "⏻": "power",
-        "😴": "cmd+alt+eject",
-        "🔒": "cmd+ctrl+q",
-        "📷": "cmd+shift+4",
         "🏠": "f3",
         "🗑": "clear"
     }
-    mappings.update(standard_mappings)
+    for display_name, combo in standard_mappings.items():
+        mappings.setdefault(display_name, combo)
 
     # Layer toggles (OverKeys handles these specially)
     layer_mappings = {
@@ -1299,25 +2544,6 @@ def extract_action_mappings_from_keymap(data):
     }
     mappings.update(layer_mappings)
 
-    # Extract actual consumer codes from keymap data
-    consumer_codes_found = set()
-
-    def scan_behaviors(obj):
-        """Recursively scan for consumer codes in keymap behaviors"""
-        if isinstance(obj, dict):
-            if 'value' in obj:
-                value = obj['value']
-                if isinstance(value, str) and value.startswith('C_'):
-                    consumer_codes_found.add(value)
-            for v in obj.values():
-                scan_behaviors(v)
-        elif isinstance(obj, list):
-            for item in obj:
-                scan_behaviors(item)
-
-    # Scan the entire keymap
-    scan_behaviors(data)
-
     # Map found consumer codes to actual system keys
     consumer_mappings = {
         # Brightness controls - actual macOS brightness keys
@@ -1347,7 +2573,7 @@ def extract_action_mappings_from_keymap(data):
     }
 
     # Add mappings for found consumer codes and their display symbols
-    for code in consumer_codes_found:
+    for code in scan.consumer_codes:
         if code in consumer_mappings:
             # Add the actual consumer code
             mappings[code] = consumer_mappings[code]
@@ -1375,176 +2601,921 @@ def extract_action_mappings_from_keymap(data):
     }
     mappings.update(mouse_mappings)
 
-    print(f"🔍 Found consumer codes: {sorted(consumer_codes_found)}")
+    progress(f"🔍 Found consumer codes: {sorted(scan.consumer_codes)}")
 
     return mappings
 
 
-def main():
-    print("🔥 Glove80 → OverKeys Converter 🔥")
-    print("No more garbage key names!")
-    print(f"Target layers: {', '.join(LAYER_NAMES)}")
+def arrange_user_layouts(keymap: Dict[str, Any], scan: KeymapScan, zmk_triggers: Dict[str, str],
+                         physical_layout: Optional[PhysicalLayout] = None) -> List[Dict[str, Any]]:
+    """One OverKeys userLayout per LAYER_NAMES layer, keys arranged by physical_layout (Glove80 by default)"""
+    if physical_layout is None:
+        physical_layout = DEFAULT_PHYSICAL_LAYOUT
+    layers = keymap.get('layers', [])
+    layer_names_list = keymap.get('layer_names', [])
 
-    try:
-        # Load keymap
-        with open("keymap.json", 'r', encoding='utf-8') as f:
-            keymap = json.load(f)
+    # Find layer indices by name
+    layer_indices = []
+    for layer_name in LAYER_NAMES:
+        if layer_name in layer_names_list:
+            layer_indices.append(layer_names_list.index(layer_name))
+        else:
+            progress(f"Warning: Layer '{layer_name}' not found")
 
-        layers = keymap.get('layers', [])
-        layer_names_list = keymap.get('layer_names', [])
+    user_layouts = []
 
-        print(f"Total layers available: {len(layers)}")
-        print(f"Layer names: {layer_names_list}")
+    # Convert each layer
+    for i in layer_indices:
+        if i >= len(layers):
+            continue
+
+        layer_labels = scan.converted_layers[i]
+        layer_name = layer_names_list[i] if i < len(layer_names_list) else f"Layer_{i}"
+
+        # Get trigger from parsed ZMK configuration
+        trigger = None
+        layer_name_lower = layer_name.lower()
+        if layer_name_lower in zmk_triggers:
+            trigger = zmk_triggers[layer_name_lower]
+        elif i > 0:
+            trigger = f"Layer_{layer_name}"
+
+        # Build layer layout
+        layout = {
+            "name": layer_name,
+            "layoutStyle": "split_matrix_explicit",
+            **physical_layout.build_rows(layer_labels),
+        }
+
+        # Add trigger if specified
+        if trigger:
+            layout["trigger"] = trigger
+            layout["type"] = "toggle"
+
+        user_layouts.append(layout)
+
+    return user_layouts
+
+
+def split_matrix_config(user_layouts: List[Dict[str, Any]], action_mappings: Dict[str, str],
+                        physical_layout: Optional[PhysicalLayout] = None) -> Dict[str, Any]:
+    """The final OverKeys configuration"""
+    return {
+        "userLayouts": user_layouts,
+        "defaultUserLayout": user_layouts[0]["name"] if user_layouts else "Base",
+        "homeRow": dict((physical_layout or DEFAULT_PHYSICAL_LAYOUT).home_row),
+        "actionMappings": action_mappings
+    }
 
-        # Parse ZMK triggers
-        print("Parsing ZMK triggers from keymap.dtsi...")
-        zmk_triggers = parse_zmk_triggers()
-        print(f"Found triggers: {zmk_triggers}")
 
+def build_split_matrix_configs(keymap: Dict[str, Any], build_cache: Optional[BuildCache] = None,
+                               operating_systems=(None,),
+                               physical_layout: Optional[PhysicalLayout] = None) -> Dict[Optional[str], Dict[str, Any]]:
+    """Convert a loaded keymap once into one OverKeys config per OPERATING_SYSTEM setting.
+
+    Layers and triggers are shared; only the macro table and actionMappings are
+    rebuilt per target. None stands for the setting in keymap.dtsi.erb itself.
+    Keys are arranged by physical_layout (the Glove80 by default).
+    """
+    layers = keymap.get('layers', [])
+    layer_names_list = keymap.get('layer_names', [])
+
+    progress(f"Total layers available: {len(layers)}")
+    progress(f"Layer names: {layer_names_list}")
+
+    # Parse ZMK triggers
+    progress("Parsing ZMK triggers from keymap.dtsi...")
+    with profile_stage('triggers'):
+        if build_cache:
+            zmk_triggers = build_cache.memo('triggers', 'keymap.dtsi', parse_zmk_triggers)
+        else:
+            zmk_triggers = parse_zmk_triggers()
+    progress(f"Found triggers: {zmk_triggers}")
+
+    # Convert every layer once; later stages reuse the results
+    progress("🔍 Scanning keymap for consumer codes...")
+    with profile_stage('layers'):
+        scan = scan_keymap(keymap, build_cache=build_cache)
+
+    cache_stats = conversion_cache.stats()
+    progress(f"♻️  Conversion cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if build_cache:
+        progress(f"♻️  Build cache: {build_cache.reused_layers} layers reused, {build_cache.converted_layers} converted")
+
+    user_layouts = arrange_user_layouts(keymap, scan, zmk_triggers, physical_layout)
+
+    configs = {}
+    for operating_system in operating_systems:
         # Generate action mappings from actual keymap data
-        print("🔍 Scanning keymap for consumer codes...")
-        action_mappings = extract_action_mappings_from_keymap(keymap)
-
-        # Find layer indices by name
-        layer_indices = []
-        for layer_name in LAYER_NAMES:
-            if layer_name in layer_names_list:
-                layer_indices.append(layer_names_list.index(layer_name))
+        def compute_macros(operating_system=operating_system):
+            return parse_zmk_macro_definitions(operating_system=operating_system)
+
+        stage_suffix = f' [{operating_system}]' if operating_system else ''
+        with profile_stage(f'macros{stage_suffix}'):
+            if build_cache:
+                memo_name = f'macros.{operating_system}' if operating_system else 'macros'
+                zmk_macros = build_cache.memo(memo_name, 'keymap.dtsi.erb', compute_macros)
             else:
-                print(f"Warning: Layer '{layer_name}' not found")
+                zmk_macros = compute_macros()
+        with profile_stage(f'action mappings{stage_suffix}'):
+            action_mappings = extract_action_mappings_from_keymap(keymap, scan, zmk_macros, operating_system)
+
+        configs[operating_system] = split_matrix_config(user_layouts, action_mappings, physical_layout)
+
+    return configs
+
+
+def build_split_matrix_config(keymap: Dict[str, Any], build_cache: Optional[BuildCache] = None,
+                              operating_system: Optional[str] = None,
+                              physical_layout: Optional[PhysicalLayout] = None) -> Dict[str, Any]:
+    """Convert a loaded keymap into the OverKeys split matrix configuration"""
+    return build_split_matrix_configs(keymap, build_cache, (operating_system,), physical_layout)[operating_system]
+
+
+@functools.lru_cache(maxsize=8)
+def dtsi_index_from_text(text: str) -> DtsiIndex:
+    """DtsiIndex of keymap.dtsi text, shared by convert_keymap() calls that pass the same text"""
+    return DtsiIndex(text)
+
+
+@functools.lru_cache(maxsize=8)
+def macro_mappings_from_text(text: str, operating_system: Optional[str] = None) -> Dict[str, str]:
+    """zmk_macro_mappings() of keymap.dtsi.erb text, shared by convert_keymap() calls"""
+    return zmk_macro_mappings(*preprocess_macro_template(text, operating_system))
+
+
+def _character_source(name: str, data) -> Optional[CharacterTable]:
+    if data is None or isinstance(data, CharacterTable):
+        return data
+    if not isinstance(data, dict):
+        raise SourceError(f"{name} data must be the parsed YAML mapping, not {type(data).__name__}")
+    return CharacterTable(data)
+
+
+def convert_keymap(keymap: Dict[str, Any], *, dtsi=None, dtsi_erb: Optional[str] = None,
+                   emoji=None, world=None, operating_system: Optional[str] = None,
+                   physical_layout: Optional[PhysicalLayout] = None,
+                   cache: Optional[ConversionCache] = None) -> Dict[str, Any]:
+    """Convert a parsed keymap.json into an OverKeys config, entirely in-process.
+
+    Nothing is read from disk or printed; every source is passed in:
+    dtsi is keymap.dtsi text or a DtsiIndex (without it there are no layer
+    triggers), dtsi_erb is keymap.dtsi.erb text (without it actionMappings
+    fall back to the default shortcuts), and emoji/world are the parsed YAML
+    mappings or CharacterTables. operating_system is 'linux', 'macos' or
+    'windows' (or 'L', 'M', 'W') and overrides the template's own setting.
+
+    Text sources are parsed once per distinct text. Pass the same cache to
+    several calls to share converted labels, as long as their character
+    data is the same.
+
+    Raises KeymapFormatError, UnknownBehaviorError, SourceError or
+    OptionError, all of which are ConversionErrors.
+    """
+    if not isinstance(keymap, dict) or not isinstance(keymap.get('layers'), (list, tuple)):
+        raise KeymapFormatError("Keymap must be a mapping with a 'layers' list")
+    layer_names = keymap.get('layer_names', [])
+    if not isinstance(layer_names, list) or not all(isinstance(name, str) for name in layer_names):
+        raise KeymapFormatError("Keymap 'layer_names' must be a list of strings")
+    if not all(isinstance(layer, (list, tuple)) for layer in keymap['layers']):
+        raise KeymapFormatError("Every keymap layer must be a list of bindings")
+    if operating_system is not None:
+        operating_system = OPERATING_SYSTEM_TARGETS.get(operating_system, operating_system)
+        if operating_system not in OPERATING_SYSTEM_NAMES:
+            raise OptionError(f"Unknown operating system {operating_system!r}")
 
-        user_layouts = []
+    try:
+        if isinstance(dtsi, str):
+            dtsi = dtsi_index_from_text(dtsi)
+        zmk_triggers = zmk_triggers_from_index(dtsi) if dtsi is not None else {}
+        zmk_macros = macro_mappings_from_text(dtsi_erb, operating_system) if dtsi_erb is not None else {}
+    except ConversionError:
+        raise
+    except Exception as e:
+        raise SourceError(f"Could not parse the DTSI sources: {e}") from e
 
-        # Convert each layer
-        for i in layer_indices:
-            if i >= len(layers):
-                continue
+    character_sources = {'emoji.yaml': _character_source('emoji', emoji), 'world.yaml': _character_source('world', world)}
+    sources_token = _character_sources.set(character_sources)
+    try:
+        with progress_muted():
+            keymap = {**keymap, 'layers': lower_layers(keymap['layers'])}
+            scan = scan_keymap(keymap, cache if cache is not None else ConversionCache())
+            user_layouts = arrange_user_layouts(keymap, scan, zmk_triggers, physical_layout)
+            action_mappings = extract_action_mappings_from_keymap(keymap, scan, zmk_macros, operating_system)
+    except ConversionError:
+        raise
+    except (AttributeError, TypeError, KeyError, IndexError) as e:
+        raise KeymapFormatError(f"Malformed binding in keymap: {e}") from e
+    finally:
+        _character_sources.reset(sources_token)
+    return split_matrix_config(user_layouts, action_mappings, physical_layout)
+
+
+def _json_pointer(path: str, key) -> str:
+    return f"{path}/{str(key).replace('~', '~0').replace('/', '~1')}"
+
+
+def json_patch(old, new, path: str = '') -> List[Dict[str, Any]]:
+    """RFC 6902 operations turning old into new, addressed as deep as the change goes.
+
+    Lists of equal length are diffed item by item. userLayouts (lists of
+    objects) keep their common prefix and add/remove at the end; rows that
+    changed length (5 keys ↔ empty) are replaced whole.
+    """
+    if type(old) is not type(new):
+        return [{'op': 'replace', 'path': path, 'value': new}]
+    if isinstance(old, dict):
+        operations = []
+        for key in old:
+            if key not in new:
+                operations.append({'op': 'remove', 'path': _json_pointer(path, key)})
+        for key, value in new.items():
+            if key in old:
+                operations.extend(json_patch(old[key], value, _json_pointer(path, key)))
+            else:
+                operations.append({'op': 'add', 'path': _json_pointer(path, key), 'value': value})
+        return operations
+    if isinstance(old, list):
+        if len(old) != len(new) and not all(isinstance(item, dict) for item in old + new):
+            return [{'op': 'replace', 'path': path, 'value': new}]
+        operations = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            operations.extend(json_patch(old_item, new_item, _json_pointer(path, index)))
+        for index in range(len(old) - 1, len(new) - 1, -1):
+            operations.append({'op': 'remove', 'path': _json_pointer(path, index)})
+        for item in new[len(old):]:
+            operations.append({'op': 'add', 'path': f'{path}/-', 'value': item})
+        return operations
+    return [] if old == new else [{'op': 'replace', 'path': path, 'value': new}]
+
+
+def apply_json_patch(document, operations: List[Dict[str, Any]]):
+    """Apply the add/remove/replace operations json_patch() emits; document is modified in place"""
+    for operation in operations:
+        parts = [part.replace('~1', '/').replace('~0', '~') for part in operation['path'].split('/')[1:]]
+        if not parts:
+            document = operation['value']  # Whole-document replace
+            continue
+        target = document
+        for part in parts[:-1]:
+            target = target[int(part) if isinstance(target, list) else part]
+        last = parts[-1]
+        if isinstance(target, list):
+            if operation['op'] == 'add':
+                target.insert(len(target) if last == '-' else int(last), operation['value'])
+            elif operation['op'] == 'remove':
+                del target[int(last)]
+            else:
+                target[int(last)] = operation['value']
+        elif operation['op'] == 'remove':
+            del target[last]
+        else:
+            target[last] = operation['value']
+    return document
+
+
+# Top-level fields of an OverKeys config (see split_matrix_config)
+CONFIG_FIELDS = ('userLayouts', 'defaultUserLayout', 'homeRow', 'actionMappings')
+
+
+def diff_keymap_file(old_path: str, keymap_path: str = "keymap.json",
+                     patch_path: str = "split_matrix_config.patch.json") -> List[Dict[str, Any]]:
+    """Write the JSON Patch from an old config (or the config of an old keymap) to keymap_path's config.
+
+    The old keymap is converted first, so converting the new one only misses
+    the conversion cache on bindings that actually changed. Both files are
+    read with load_keymap_fields, so an old keymap's unused fields are
+    skipped just like the new one's.
+    """
+    with profile_stage('load'):
+        old = load_keymap_fields(old_path, KEYMAP_FIELDS + CONFIG_FIELDS)
+        keymap = load_keymap_fields(keymap_path)
+    if 'userLayouts' in old:
+        old_config = old
+    elif 'layers' in old:
+        old_config = build_split_matrix_config(old)
+    else:
+        raise ValueError(f"{old_path} is neither an OverKeys config nor a keymap")
 
-            layer_data = layers[i]
-            layer_name = layer_names_list[i] if i < len(layer_names_list) else f"Layer_{i}"
-
-            # Get trigger from parsed ZMK configuration
-            trigger = None
-            layer_name_lower = layer_name.lower()
-            if layer_name_lower in zmk_triggers:
-                trigger = zmk_triggers[layer_name_lower]
-            elif i > 0:
-                trigger = f"Layer_{layer_name}"
-
-            # Build layer layout
-            layout = {
-                "name": layer_name,
-                "layoutStyle": "split_matrix_explicit",
-                "leftHand": {"mainRows": [], "thumbRows": []},
-                "rightHand": {"mainRows": [], "thumbRows": []}
-            }
-
-            # Build left hand main rows
-            for row_positions in GLOVE80_LAYOUT['left_main_rows']:
-                row = []
-                for pos in row_positions:
-                    if pos < len(layer_data):
-                        key = convert_zmk_key(layer_data[pos], layer_name)
-                        row.append(key)
-                    else:
-                        row.append(None)
-
-                # Normalize row length and clean up
-                if len(row) == 5:
-                    row.append(None)  # Add null at end for left hand 5-key rows
-
-                # Replace all-null rows with empty arrays
-                if all(key is None for key in row):
-                    row = []
-
-                layout["leftHand"]["mainRows"].append(row)
-
-            # Build right hand main rows
-            for row_positions in GLOVE80_LAYOUT['right_main_rows']:
-                row = []
-                for pos in row_positions:
-                    if pos < len(layer_data):
-                        key = convert_zmk_key(layer_data[pos], layer_name)
-                        row.append(key)
-                    else:
-                        row.append(None)
-
-                # Normalize row length and clean up
-                if len(row) == 5:
-                    row.insert(0, None)  # Add null at start for right hand 5-key rows
-
-                # Replace all-null rows with empty arrays
-                if all(key is None for key in row):
-                    row = []
-
-                layout["rightHand"]["mainRows"].append(row)
-
-            # Build thumb rows
-            for row_positions in GLOVE80_LAYOUT['left_thumb_rows']:
-                row = []
-                for pos in row_positions:
-                    if pos < len(layer_data):
-                        key = convert_zmk_key(layer_data[pos], layer_name)
-                        row.append(key)
-                    else:
-                        row.append(None)
-                # Replace all-null rows with empty arrays
-                if all(key is None for key in row):
-                    row = []
-
-                layout["leftHand"]["thumbRows"].append(row)
-
-            for row_positions in GLOVE80_LAYOUT['right_thumb_rows']:
-                row = []
-                for pos in row_positions:
-                    if pos < len(layer_data):
-                        key = convert_zmk_key(layer_data[pos], layer_name)
-                        row.append(key)
-                    else:
-                        row.append(None)
-                # Replace all-null rows with empty arrays
-                if all(key is None for key in row):
-                    row = []
-
-                layout["rightHand"]["thumbRows"].append(row)
-
-            # Add trigger if specified
-            if trigger:
-                layout["trigger"] = trigger
-                layout["type"] = "toggle"
-
-            user_layouts.append(layout)
-
-        # Create final configuration
-        config = {
-            "userLayouts": user_layouts,
-            "defaultUserLayout": user_layouts[0]["name"] if user_layouts else "Base",
-            "homeRow": {
-                "rowIndex": 4,
-                "leftPosition": 2,
-                "rightPosition": 2
-            },
-            "actionMappings": action_mappings
-        }
+    config = build_split_matrix_config(keymap)
+    with profile_stage('diff'):
+        operations = json_patch(old_config, config)
 
-        # Save to file with compact arrays
-        with open("split_matrix_config.json", 'w', encoding='utf-8') as f:
-            f.write(format_compact_json(config))
+    tmp_path = f'{patch_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        # One operation per line, like the compact config rows
+        lines = (json.dumps(operation, ensure_ascii=False) for operation in operations)
+        f.write('[\n' + ',\n'.join(lines) + '\n]\n' if operations else '[]\n')
+    os.replace(tmp_path, patch_path)
+    return operations
 
-        print("\n🎉 SUCCESS! configuration saved to:")
-        print("- split_matrix_config.json")
-        print("\nKey improvements:")
-        print("✅ Consumer keys: C_PLAY → Play, C_MEDIA_HOME → MediaHome")
-        print("✅ Home row mods: Show tap keys (N, R, T, S) not mod names (LGUI)")
-        print("✅ Better system keys: KP_NUM → NumLock, PSCRN → PrintScreen")
-        print("✅ Clean keypad notation: ⁷⁸⁹ → 789, ⊖⊕⊗ → -+*")
-        print("✅ Dynamic action mappings: Extracted from actual ZMK consumer codes")
-        print("✅ Layer toggles: Semantic actions for OverKeys integration")
 
+def write_config_atomically(config: Dict[str, Any], output_path: str):
+    """Write the config via a temp file + rename, so readers and parallel runs never see partial output"""
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    try:
+        if profiler:
+            # Format up front so the profile can tell formatting and disk I/O apart
+            with profile_stage('format'):
+                text = format_compact_json(config)
+            with profile_stage('write'), open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        else:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                write_compact_json(config, f)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def convert_keymap_file(keymap_path: str = "keymap.json", output_path: str = "split_matrix_config.json",
+                        use_cache: bool = True, layout_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Load a keymap file, convert it and save the config with compact arrays.
+
+    With use_cache, only layers whose bindings or dependencies changed are
+    re-converted, and nothing is done (None is returned) when no input
+    changed since the last build. layout_path is a physical layout JSON file
+    to use instead of the Glove80's.
+    """
+    build_cache = None
+    if use_cache:
+        build_cache = BuildCache(build_cache_path(output_path))
+        build_cache.hash_inputs(converter_inputs(keymap_path, layout_path))
+        if build_cache.is_up_to_date(output_path):
+            return None
+
+    with profile_stage('load'):
+        keymap = load_keymap_fields(keymap_path)
+        physical_layout = load_physical_layout(layout_path) if layout_path else None
+    config = build_split_matrix_config(keymap, build_cache, physical_layout=physical_layout)
+    write_config_atomically(config, output_path)
+    if build_cache:
+        build_cache.save(output_path)
+    return config
+
+
+def os_output_path(output_path: str, os_name: str) -> str:
+    """split_matrix_config.json → split_matrix_config.linux.json"""
+    root, ext = os.path.splitext(output_path)
+    return f'{root}.{os_name}{ext}'
+
+
+def per_os_build_cache_path(output_path: str) -> str:
+    """split_matrix_config.json → .split_matrix_config.linux+macos+windows.json.cache
+
+    Named after the output set so it never clobbers the single config's cache.
+    """
+    return build_cache_path(os_output_path(output_path, '+'.join(OPERATING_SYSTEM_TARGETS)))
+
+
+def convert_keymap_file_per_os(keymap_path: str = "keymap.json", output_path: str = "split_matrix_config.json",
+                               use_cache: bool = True,
+                               layout_path: Optional[str] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Like convert_keymap_file, but write one config per operating system from a single parse.
+
+    Returns {output path: config}, or None when every output is up to date.
+    """
+    output_paths = {os_output_path(output_path, os_name): code for os_name, code in OPERATING_SYSTEM_TARGETS.items()}
+    build_cache = None
+    if use_cache:
+        build_cache = BuildCache(per_os_build_cache_path(output_path))
+        build_cache.hash_inputs(converter_inputs(keymap_path, layout_path))
+        if build_cache.is_up_to_date(*output_paths):
+            return None
+
+    with profile_stage('load'):
+        keymap = load_keymap_fields(keymap_path)
+        physical_layout = load_physical_layout(layout_path) if layout_path else None
+    configs = build_split_matrix_configs(keymap, build_cache, tuple(output_paths.values()), physical_layout)
+    for path, code in output_paths.items():
+        write_config_atomically(configs[code], path)
+    if build_cache:
+        build_cache.save(*output_paths)
+    return {path: configs[code] for path, code in output_paths.items()}
+
+
+def _stat_signature(filepath: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def watch_keymap(keymap_path: str = "keymap.json", output_path: str = "split_matrix_config.json",
+                 interval: float = 0.2, quiet: bool = False, layout_path: Optional[str] = None):
+    """Regenerate the config whenever an input changes, keeping parsed state warm in memory
+
+    With quiet, only errors are reported.
+    """
+    watched = converter_inputs(keymap_path, layout_path)
+    build_cache = BuildCache(build_cache_path(output_path))
+    keymap = None
+    keymap_hash = None
+    signatures = None
+
+    if not quiet:
+        print(f"👀 Watching {', '.join(watched)} (Ctrl+C to stop)")
+    try:
+        while True:
+            current_signatures = {path: _stat_signature(path) for path in watched}
+            if current_signatures != signatures:
+                signatures = current_signatures
+                started = time.perf_counter()
+                try:
+                    input_hashes = build_cache.hash_inputs(watched)
+                    if not build_cache.is_up_to_date(output_path):
+                        # Only re-parse keymap.json when its content changed
+                        if keymap is None or input_hashes[keymap_path] != keymap_hash:
+                            keymap = load_keymap_fields(keymap_path)
+                            keymap_hash = input_hashes[keymap_path]
+                        physical_layout = load_physical_layout(layout_path) if layout_path else None
+                        with progress_muted():
+                            config = build_split_matrix_config(keymap, build_cache, physical_layout=physical_layout)
+                        write_config_atomically(config, output_path)
+                        build_cache.save(output_path)
+                        elapsed_ms = (time.perf_counter() - started) * 1000
+                        if not quiet:
+                            print(f"🔄 {time.strftime('%H:%M:%S')} regenerated {output_path} in {elapsed_ms:.0f}ms "
+                                  f"({build_cache.converted_layers} layers converted, {build_cache.reused_layers} reused)")
+                except Exception as e:
+                    print(f"❌ {time.strftime('%H:%M:%S')} Error: {e}")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        if not quiet:
+            print("\n👋 Stopped watching")
+
+
+SERVER_SOCKET = '.split_matrix.sock'
+SERVER_RESULT_LIMIT = 64
+SERVER_LINE_LIMIT = 64 * 1024 * 1024  # Requests may carry a whole keymap.json inline
+
+
+class ConversionServer:
+    """--serve: answer conversion requests on a Unix socket, keeping parsed inputs warm.
+
+    The protocol is one JSON object per line in each direction. A request
+    names a keymap file ("keymap", default keymap.json) or carries the keymap
+    itself ("keymapData"). Optional "os" (linux/macos/windows) overrides the
+    template's OPERATING_SYSTEM, and "layer" asks for that one userLayout
+    instead of the whole config; {"stats": true} reports the counters.
+    Responses are {"ok": true, "config" | "layout": ...} or
+    {"ok": false, "type": ..., "error": ...}.
+
+    Keymaps, the DTSI index, macro mappings and character tables are reparsed
+    only when their files change. Identical requests in flight at the same
+    time share one conversion.
+    """
+
+    def __init__(self, executor=None, physical_layout: Optional[PhysicalLayout] = None):
+        self.executor = executor  # Conversions run here, off the event loop
+        self.physical_layout = physical_layout
+        self.conversions = 0
+        self.coalesced = 0
+        self._keymaps = {}  # Path → (stat signature, keymap)
+        self._template = (None, None)  # keymap.dtsi.erb (stat signature, text)
+        self._caches = {}  # (emoji table, world table) → ConversionCache of labels made with them
+        self._results = {}  # Request key → config, oldest first
+        self._in_flight = {}  # Request key → future of its config
+
+    def _load_keymap(self, path: str) -> Dict[str, Any]:
+        signature = _stat_signature(path)
+        cached = self._keymaps.get(path)
+        if cached is None or cached[0] != signature:
+            cached = self._keymaps[path] = (signature, load_keymap_fields(path))
+        return cached[1]
+
+    def _sources(self) -> Dict[str, Any]:
+        """convert_keymap() sources from the converter's input files; missing files are left out"""
+        sources = {}
+        with contextlib.suppress(FileNotFoundError):
+            sources['dtsi'] = load_dtsi_index('keymap.dtsi')
+        signature = _stat_signature('keymap.dtsi.erb')
+        if signature is not None:
+            if signature != self._template[0]:
+                with open('keymap.dtsi.erb', 'r', encoding='utf-8') as f:
+                    self._template = (signature, f.read())
+            sources['dtsi_erb'] = self._template[1]
+        for name in ('emoji', 'world'):
+            with contextlib.suppress(FileNotFoundError):
+                sources[name] = load_character_table(f'{name}.yaml')
+        return sources
+
+    def _convert(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Worker side of a request: load what changed and convert"""
+        keymap = request.get('keymapData')
+        if keymap is None:
+            keymap = self._load_keymap(request.get('keymap', 'keymap.json'))
+        sources = self._sources()
+        tables = (sources.get('emoji'), sources.get('world'))
+        cache = self._caches.get(tables)
+        if cache is None:
+            self._caches = {tables: ConversionCache()}  # Labels from older character data are stale
+            cache = self._caches[tables]
+        self.conversions += 1
+        return convert_keymap(keymap, operating_system=request.get('os'), physical_layout=self.physical_layout,
+                              cache=cache, **sources)
+
+    def request_key(self, request: Dict[str, Any]) -> Tuple[Any, ...]:
+        """What a request's config depends on: the keymap's content or file version, the OS and the inputs"""
+        import hashlib
+        if 'keymapData' in request:
+            canonical = json.dumps(request['keymapData'], sort_keys=True, separators=(',', ':'))
+            keymap_key = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+        else:
+            path = os.path.abspath(request.get('keymap', 'keymap.json'))
+            keymap_key = (path, _stat_signature(path))
+        return keymap_key, request.get('os'), tuple(_stat_signature(path) for path in CONVERTER_INPUTS)
+
+    async def convert(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """The config for a request, shared with identical requests that are already running"""
+        import asyncio
+        key = self.request_key(request)
+        if key in self._results:
+            return self._results[key]
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self._convert, request)
+            self._in_flight[key] = future
+            future.add_done_callback(functools.partial(self._finish, key))
+        # Shielded: a client hanging up mustn't cancel the conversion other clients are waiting on
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Tuple[Any, ...], future) -> None:
+        """Done callback: remember the config before forgetting the conversion, so no request sees neither"""
+        if not future.cancelled() and future.exception() is None:
+            self._results.pop(key, None)
+            self._results[key] = future.result()
+            while len(self._results) > SERVER_RESULT_LIMIT:
+                del self._results[next(iter(self._results))]
+        del self._in_flight[key]
+
+    async def respond(self, line: bytes) -> Dict[str, Any]:
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object")
+            if request.get('stats'):
+                return {'ok': True, 'conversions': self.conversions, 'coalesced': self.coalesced,
+                        'cachedResults': len(self._results)}
+            config = await self.convert(request)
+            layer = request.get('layer')
+            if layer is None:
+                return {'ok': True, 'config': config}
+            for layout in config['userLayouts']:
+                if layout['name'] == layer:
+                    return {'ok': True, 'layout': layout}
+            raise LookupError(f"No layer named {layer!r}")
+        except Exception as e:
+            return {'ok': False, 'type': type(e).__name__, 'error': str(e)}
+
+    async def handle_client(self, reader, writer):
+        """One connection: answer its request lines in order until it closes"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.respond(line)
+                writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ValueError as e:
+            # Request line over SERVER_LINE_LIMIT: the stream can't be resynchronized, so answer and hang up
+            writer.write(json.dumps({'ok': False, 'type': type(e).__name__, 'error': str(e)}).encode('utf-8') + b'\n')
+        except ConnectionError:
+            pass  # Client went away mid-response
+        finally:
+            writer.close()
+
+
+def serve(socket_path: str = SERVER_SOCKET, quiet: bool = False, layout_path: Optional[str] = None):
+    """Run a ConversionServer on socket_path until interrupted"""
+    import asyncio
+    import concurrent.futures
+    import signal
+
+    physical_layout = load_physical_layout(layout_path) if layout_path else None
+
+    async def run():
+        # One worker: conversions share caches that aren't meant for concurrent writers
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            server = ConversionServer(executor, physical_layout)
+            listener = await asyncio.start_unix_server(server.handle_client, path=socket_path, limit=SERVER_LINE_LIMIT)
+            if not quiet:
+                print(f"🛰️  Serving conversions on {socket_path} (Ctrl+C to stop)")
+            # A service manager's SIGTERM stops the server as cleanly as Ctrl+C
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+            async with listener:
+                with contextlib.suppress(asyncio.CancelledError):
+                    await listener.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        if not quiet:
+            print("\n👋 Stopped serving")
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)
+
+
+def query_server(request: Dict[str, Any], socket_path: str = SERVER_SOCKET) -> Dict[str, Any]:
+    """Send one request to a --serve process and return its response"""
+    import socket
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with client.makefile('rb') as responses:
+            return json.loads(responses.readline())
+
+
+def batch_output_path(keymap_path: str, output_dir: str) -> str:
+    """layouts/QWERTY.json → <output_dir>/split_matrix_config.QWERTY.json"""
+    stem = os.path.splitext(os.path.basename(keymap_path))[0]
+    return os.path.join(output_dir, f'split_matrix_config.{stem}.json')
+
+
+def _convert_batch_item(keymap_path: str, output_path: str, use_cache: bool = True, per_os: bool = False,
+                        layout_path: Optional[str] = None) -> Tuple[str, str, float, Optional[str]]:
+    """Worker: convert one keymap quietly, reporting (input, output, seconds, error)"""
+    started = time.perf_counter()
+    if use_cache:
+        enable_snapshot_cache()  # Spawned workers don't inherit the parent's
+    try:
+        with progress_muted():
+            if per_os:
+                convert_keymap_file_per_os(keymap_path, output_path, use_cache, layout_path)
+            else:
+                convert_keymap_file(keymap_path, output_path, use_cache, layout_path)
+        error = None
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    return keymap_path, output_path, time.perf_counter() - started, error
+
+
+def batch_output_paths(keymap_paths: List[str], output_dir: str) -> List[str]:
+    """batch_output_path() of each keymap, creating output_dir; no two keymaps may share an output"""
+    output_paths = [batch_output_path(path, output_dir) for path in keymap_paths]
+    duplicates = sorted({path for path in output_paths if output_paths.count(path) > 1})
+    if duplicates:
+        raise ValueError(f"Several keymaps would write the same output: {', '.join(duplicates)}")
+    os.makedirs(output_dir, exist_ok=True)
+    return output_paths
+
+
+def run_batch(keymap_paths: List[str], output_dir: str = '.', jobs: int = 1, use_cache: bool = True,
+              per_os: bool = False, layout_path: Optional[str] = None) -> List[Tuple[str, str, float, Optional[str]]]:
+    """Convert many keymaps, across a process pool when jobs > 1"""
+    output_paths = batch_output_paths(keymap_paths, output_dir)
+
+    use_cache_flags = [use_cache] * len(keymap_paths)
+    per_os_flags = [per_os] * len(keymap_paths)
+    layout_paths = [layout_path] * len(keymap_paths)
+    if jobs <= 1 or len(keymap_paths) <= 1:
+        return [_convert_batch_item(*item)
+                for item in zip(keymap_paths, output_paths, use_cache_flags, per_os_flags, layout_paths)]
+    import concurrent.futures  # Only batch runs pay for the process pool machinery
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_convert_batch_item, keymap_paths, output_paths, use_cache_flags, per_os_flags,
+                             layout_paths))
+
+
+def overlay_base_layer(keymap: Dict[str, Any], base: Dict[str, Any]) -> Dict[str, Any]:
+    """keymap with its base layer swapped for base's (a layouts/*.json keymap).
+
+    Only the top-level dict and the outer layers tuple are new: every other
+    layer, and every other field, is the very object of keymap.
+    """
+    base_layers = lower_layers(base.get('layers'))
+    if not isinstance(base_layers, tuple) or not base_layers or not isinstance(base_layers[0], tuple):
+        raise KeymapFormatError("Base layout must have a 'layers' list whose first layer is a list of bindings")
+    layers = keymap.get('layers') or ((),)
+    if len(base_layers[0]) != len(layers[0]):
+        raise KeymapFormatError(f"Base layer has {len(base_layers[0])} keys, the keymap's has {len(layers[0])}")
+    return {**keymap, 'layers': (base_layers[0], *layers[1:])}
+
+
+OVERLAY_LAYOUTS = 'layouts/*.json'
+
+
+def run_layout_overlays(base_paths: List[str], keymap_path: str = "keymap.json", output_dir: str = '.',
+                        use_cache: bool = True,
+                        layout_path: Optional[str] = None) -> List[Tuple[str, str, float, Optional[str]]]:
+    """Convert keymap.json once per base layout file, each base layer overlaid on the same other layers.
+
+    The keymap, triggers and macros are loaded once, the layers every overlay
+    shares are converted once, and labels come from the shared conversion
+    cache. Each base layout's userLayout is named after its own base layer.
+    Results are in run_batch()'s format; up to date outputs are skipped.
+    """
+    output_paths = batch_output_paths(base_paths, output_dir)
+    build_caches = dict.fromkeys(output_paths)
+    if use_cache:
+        for base_path, output_path in zip(base_paths, output_paths):
+            build_cache = build_caches[output_path] = BuildCache(build_cache_path(output_path))
+            build_cache.hash_inputs([*converter_inputs(keymap_path, layout_path), base_path])
+    stale = {output_path for output_path, build_cache in build_caches.items()
+             if build_cache is None or not build_cache.is_up_to_date(output_path)}
+
+    if stale:
+        keymap = load_keymap_fields(keymap_path)
+        keymap_base_name = (keymap.get('layer_names') or [None])[0]
+        physical_layout = load_physical_layout(layout_path) if layout_path else None
+        zmk_triggers = parse_zmk_triggers()
+        zmk_macros = parse_zmk_macro_definitions()
+    shared_records = {}
+
+    results = []
+    for base_path, output_path in zip(base_paths, output_paths):
+        started = time.perf_counter()
+        error = None
+        if output_path in stale:
+            try:
+                base = load_keymap_fields(base_path, ('layer_names', 'layers'))
+                base_name = (base.get('layer_names') or [os.path.splitext(os.path.basename(base_path))[0]])[0]
+                overlay = overlay_base_layer(keymap, base)
+                scan = scan_keymap(overlay, shared_records=shared_records)
+                user_layouts = [dict(layout, name=base_name) if layout['name'] == keymap_base_name else layout
+                                for layout in arrange_user_layouts(overlay, scan, zmk_triggers, physical_layout)]
+                action_mappings = extract_action_mappings_from_keymap(overlay, scan, zmk_macros)
+                write_config_atomically(split_matrix_config(user_layouts, action_mappings, physical_layout),
+                                        output_path)
+                if build_caches[output_path]:
+                    build_caches[output_path].save(output_path)
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+        results.append((base_path, output_path, time.perf_counter() - started, error))
+    return results
+
+
+def print_batch_summary(results: List[Tuple[str, str, float, Optional[str]]], wall_seconds: float,
+                        quiet: bool = False):
+    """Result table of a batch run; with quiet, only the failures"""
+    if quiet:
+        for keymap_path, _, _, error in results:
+            if error:
+                print(f"❌ {keymap_path}: {error}")
+        return
+
+    print(f"\n{'Keymap':<40} {'Time':>9}  Result")
+    for keymap_path, output_path, seconds, error in results:
+        outcome = f"❌ {error}" if error else f"✅ {output_path}"
+        print(f"{keymap_path:<40} {seconds * 1000:>7.1f}ms  {outcome}")
+    failures = sum(1 for result in results if result[3])
+    print(f"\n{len(results) - failures} converted, {failures} failed in {wall_seconds:.2f}s")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> 'argparse.Namespace':
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert Glove80 keymaps to OverKeys split matrix layouts")
+    parser.add_argument('keymaps', nargs='*',
+                        help="keymap JSON files to batch convert (default: keymap.json → split_matrix_config.json)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="parallel worker processes for batch conversion (default: CPU count)")
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help="directory for batch outputs, named split_matrix_config.<keymap>.json")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="ignore the build and snapshot caches: re-parse every input and re-convert every layer")
+    parser.add_argument('--all-os', action='store_true',
+                        help="write split_matrix_config.{linux,macos,windows}.json instead of one config for the keymap's own OS")
+    parser.add_argument('--layout', metavar='FILE',
+                        help="physical layout JSON (key positions per hand/section/row, like GLOVE80_LAYOUT) "
+                             "for boards other than the Glove80")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="only report errors, skipping the progress output")
+    parser.add_argument('--profile', nargs='?', const='split_matrix_profile.json', metavar='REPORT',
+                        help="write per-stage time/memory and per-behavior counters of the keymap.json "
+                             "conversion as JSON, converting even when the build is up to date "
+                             "(default: split_matrix_profile.json)")
+    parser.add_argument('-w', '--watch', action='store_true',
+                        help="regenerate split_matrix_config.json whenever keymap.json, the DTSI or YAML files change")
+    parser.add_argument('--interval', type=float, default=0.2,
+                        help="seconds between file change checks in watch mode (default: 0.2)")
+    parser.add_argument('--diff', metavar='OLD',
+                        help="instead of the config, write an RFC 6902 JSON Patch from OLD (a previous config, or "
+                             "the keymap it came from) to the config of keymap.json")
+    parser.add_argument('--patch-output', default='split_matrix_config.patch.json', metavar='FILE',
+                        help="where --diff writes the patch (default: split_matrix_config.patch.json)")
+    parser.add_argument('--serve', nargs='?', const=SERVER_SOCKET, metavar='SOCKET',
+                        help="answer JSON-lines conversion requests on a Unix socket, keeping parsed inputs "
+                             f"warm (default: {SERVER_SOCKET})")
+    parser.add_argument('--overlay', action='store_true',
+                        help="treat the keymaps (default: layouts/*.json) as base layouts: overlay each one's base "
+                             "layer onto keymap.json and write a config per layout")
+    args = parser.parse_args(argv)
+    if args.overlay and (args.watch or args.serve or args.diff or args.all_os or args.profile):
+        parser.error("--overlay only combines with base layout files, --output-dir, --layout and --no-cache")
+    if args.profile and (args.keymaps or args.watch or args.serve):
+        parser.error("--profile only applies to the default keymap.json conversion")
+    if args.serve and (args.keymaps or args.watch):
+        parser.error("--serve can't be combined with batch keymaps or --watch")
+    if args.diff and (args.keymaps or args.watch or args.serve or args.all_os):
+        parser.error("--diff only applies to the default keymap.json conversion")
+    return args
+
+
+def write_profile_report(path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profiler.report(), f, indent=2, ensure_ascii=False)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if not args.no_cache:
+        enable_snapshot_cache()
+
+    if args.serve:
+        serve(args.serve, args.quiet, args.layout)
+        return
+
+    if args.watch:
+        watch_keymap(interval=args.interval, quiet=args.quiet, layout_path=args.layout)
+        return
+
+    if args.overlay:
+        started = time.perf_counter()
+        import glob
+        base_paths = args.keymaps or sorted(glob.glob(OVERLAY_LAYOUTS))
+        try:
+            with progress_muted():
+                results = run_layout_overlays(base_paths, "keymap.json", args.output_dir, not args.no_cache,
+                                              args.layout)
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+        print_batch_summary(results, time.perf_counter() - started, args.quiet)
+        if any(error for _, _, _, error in results):
+            sys.exit(1)
+        return
+
+    if args.keymaps:
+        started = time.perf_counter()
+        try:
+            results = run_batch(args.keymaps, args.output_dir, args.jobs, not args.no_cache, args.all_os,
+                                args.layout)
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+        print_batch_summary(results, time.perf_counter() - started, args.quiet)
+        if any(error for _, _, _, error in results):
+            sys.exit(1)
+        return
+
+    if not args.quiet:
+        print("🔥 Glove80 → OverKeys Converter 🔥")
+        print("No more garbage key names!")
+        print(f"Target layers: {', '.join(LAYER_NAMES)}")
+
+    # A profile of an up to date build would measure nothing, so profiling always converts
+    use_build_cache = not (args.no_cache or args.profile)
+
+    try:
+        with profiling() if args.profile else contextlib.nullcontext(), \
+                progress_muted() if args.quiet else contextlib.nullcontext():
+            if args.diff:
+                output_paths = [args.patch_output]
+                outputs = diff_keymap_file(args.diff, "keymap.json", args.patch_output)
+            elif args.all_os:
+                output_paths = [os_output_path("split_matrix_config.json", os_name) for os_name in OPERATING_SYSTEM_TARGETS]
+                outputs = convert_keymap_file_per_os("keymap.json", "split_matrix_config.json", use_build_cache,
+                                                     args.layout)
+            else:
+                output_paths = ["split_matrix_config.json"]
+                outputs = convert_keymap_file("keymap.json", "split_matrix_config.json", use_build_cache, args.layout)
+            if args.profile:
+                write_profile_report(args.profile)
     except Exception as e:
         print(f"❌ Error: {e}")
         sys.exit(1)
 
+    if args.quiet:
+        return
+    if args.profile:
+        print(f"📊 Profile saved to {args.profile}")
+
+    if args.diff:
+        print(f"\n🩹 {len(outputs)} patch operations saved to {args.patch_output}")
+        return
+
+    if outputs is None:
+        print(f"\n✨ {', '.join(output_paths)} {'is' if len(output_paths) == 1 else 'are'} up to date")
+        return
+
+    print("\n🎉 SUCCESS! configuration saved to:")
+    for output_path in output_paths:
+        print(f"- {output_path}")
+    print("\nKey improvements:")
+    print("✅ Consumer keys: C_PLAY → Play, C_MEDIA_HOME → MediaHome")
+    print("✅ Home row mods: Show tap keys (N, R, T, S) not mod names (LGUI)")
+    print("✅ Better system keys: KP_NUM → NumLock, PSCRN → PrintScreen")
+    print("✅ Clean keypad notation: ⁷⁸⁹ → 789, ⊖⊕⊗ → -+*")
+    print("✅ Dynamic action mappings: Extracted from actual ZMK consumer codes")
+    print("✅ Layer toggles: Semantic actions for OverKeys integration")
+
 
 if __name__ == '__main__':
     main()
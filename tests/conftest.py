@@ -0,0 +1,27 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import keymap_to_split_matrix as converter  # noqa: E402
+
+# What a conversion of keymap.json reads (see CONVERTER_INPUTS), plus the YAML snapshots
+INPUT_FILES = ('keymap.json', 'keymap.dtsi', 'keymap.dtsi.erb', 'emoji.yaml', 'world.yaml',
+               'emoji.snapshot.json', 'world.snapshot.json')
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """A scratch copy of the converter's inputs as the working directory, with fresh module caches"""
+    for name in INPUT_FILES:
+        shutil.copy(os.path.join(REPO, name), tmp_path / name)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(converter, 'snapshot_cache', None)
+    converter.conversion_cache.clear()
+    converter._character_tables.clear()
+    converter._dtsi_indexes.clear()
+    return tmp_path
@@ -0,0 +1,129 @@
+import asyncio
+import copy
+import json
+
+import keymap_to_split_matrix as converter
+
+
+def test_profile_converts_even_when_up_to_date(workdir):
+    converter.main(['-q'])
+    converter.main(['-q'])  # Warm: the build cache says there is nothing to do
+    converter.conversion_cache.clear()  # As in a new process
+
+    converter.main(['-q', '--profile', 'profile.json'])
+
+    report = json.loads((workdir / 'profile.json').read_text(encoding='utf-8'))
+    stage_names = {stage['name'] for stage in report['stages']}
+    assert {'load', 'layers', 'format'} <= stage_names
+    assert report['behaviors']['convert_zmk_key']
+    assert converter.profiler is None
+
+
+def test_all_os_fallbacks_follow_each_target(workdir):
+    (workdir / 'keymap.dtsi.erb').unlink()  # No parsed macros: every shortcut is a fallback
+
+    configs = converter.convert_keymap_file_per_os(use_cache=False)
+
+    assert configs['split_matrix_config.macos.json']['actionMappings']['Cut'] == 'cmd+x'
+    assert configs['split_matrix_config.linux.json']['actionMappings']['Cut'] == 'ctrl+x'
+    assert configs['split_matrix_config.windows.json']['actionMappings']['🔍'] == 'ctrl+f'
+
+
+def test_all_os_and_single_builds_keep_separate_caches(workdir):
+    converter.convert_keymap_file()
+    assert converter.convert_keymap_file_per_os() is not None  # Not fooled by the single build's cache
+    assert converter.convert_keymap_file() is None  # ...nor did it overwrite that cache
+    assert converter.convert_keymap_file_per_os() is None
+
+
+def test_all_os_shortcuts_come_from_the_template(workdir):
+    configs = converter.convert_keymap_file_per_os(use_cache=False)
+    linux = configs['split_matrix_config.linux.json']['actionMappings']
+    windows = configs['split_matrix_config.windows.json']['actionMappings']
+
+    assert windows['🔒'] == 'cmd+l'  # _LOCK is LG(L) on Windows
+    assert '🔒' not in linux and '😴' not in linux  # K_LOCK and C_SLEEP are no key combos
+    assert linux['Home'] == windows['Home'] == 'home'
+
+
+def test_diff_reads_an_old_keymap_or_config(workdir):
+    converter.convert_keymap_file(use_cache=False)
+
+    assert converter.diff_keymap_file('keymap.json') == []
+    assert converter.diff_keymap_file('split_matrix_config.json') == []
+
+
+def test_build_cache_rebuilds_only_changed_layers(workdir):
+    converter.convert_keymap_file()
+    assert converter.convert_keymap_file() is None  # Warm: nothing changed, nothing written
+
+    keymap = json.loads((workdir / 'keymap.json').read_text(encoding='utf-8'))
+    keymap['layers'][1][0] = {'value': '&kp', 'params': [{'value': 'Q', 'params': []}]}
+    (workdir / 'keymap.json').write_text(json.dumps(keymap), encoding='utf-8')
+
+    build_cache = converter.BuildCache(converter.build_cache_path('split_matrix_config.json'))
+    build_cache.hash_inputs(converter.converter_inputs('keymap.json'))
+    assert not build_cache.is_up_to_date('split_matrix_config.json')
+    with converter.progress_muted():
+        config = converter.build_split_matrix_config(converter.load_keymap_fields('keymap.json'), build_cache)
+
+    assert build_cache.converted_layers == 1
+    assert build_cache.reused_layers > 1
+    assert config == converter.convert_keymap_file(use_cache=False)
+
+
+def test_snapshot_cache_drops_stale_entries(workdir):
+    cache = converter.enable_snapshot_cache()
+    first = converter.load_keymap_fields('keymap.json')
+    assert converter.load_keymap_fields('keymap.json') == first
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+
+    keymap = json.loads((workdir / 'keymap.json').read_text(encoding='utf-8'))
+    keymap['layer_names'][0] = 'Renamed'
+    (workdir / 'keymap.json').write_text(json.dumps(keymap), encoding='utf-8')
+
+    assert converter.load_keymap_fields('keymap.json')['layer_names'][0] == 'Renamed'
+    assert cache.stats() == {'hits': 1, 'misses': 2}
+    assert len(list((workdir / converter.SNAPSHOT_CACHE_DIR).glob('*.pickle'))) == 1  # The stale entry is gone
+
+    cache.converter_hash = 'a different converter'
+    converter.load_keymap_fields('keymap.json')
+    assert cache.stats() == {'hits': 1, 'misses': 3}
+
+
+def test_server_coalesces_identical_requests(workdir):
+    server = converter.ConversionServer()
+
+    async def requests():
+        concurrent = await asyncio.gather(server.respond(b'{"os": "linux"}'), server.respond(b'{"os": "linux"}'))
+        return concurrent + [await server.respond(b'{"os": "linux"}')]  # Answered from the finished result
+    first, second, later = asyncio.run(requests())
+
+    assert first['ok'] and first == second == later
+    assert (server.conversions, server.coalesced) == (1, 1)
+
+
+def test_json_patch_round_trips(workdir):
+    config = converter.convert_keymap_file(use_cache=False)
+    edited = copy.deepcopy(config)
+    edited['userLayouts'][0]['name'] = 'Renamed'
+    edited['userLayouts'][1]['leftHand']['mainRows'][0] = []  # A row changing length is replaced whole
+    del edited['userLayouts'][-1]
+    edited['actionMappings']['a/b~c'] = 'cmd+x'  # Escaped in the JSON pointer
+    del edited['homeRow']
+
+    for old, new in [(config, edited), (edited, config), ({'a': [1, 2]}, {'a': {'b': None}}), ([1], 'scalar')]:
+        assert converter.apply_json_patch(copy.deepcopy(old), converter.json_patch(old, new)) == new
+
+
+def test_bindings_are_interned_per_load(workdir):
+    first = converter.load_keymap_fields('keymap.json', ('layers',))['layers']
+    second = converter.load_keymap_fields('keymap.json', ('layers',))['layers']
+
+    keys = [key for layer in first for key in layer]
+    assert len({id(key) for key in keys}) == len(set(keys)) < len(keys)  # Equal bindings are one object
+    assert first == second and not any(a is b for a, b in zip(first[0], second[0]))  # No table shared across loads
+
+    lowered = converter.lower_layers([[{'value': '&kp', 'params': [{'value': 'A', 'params': []}]}] * 2])
+    assert lowered[0][0] is lowered[0][1]
+    assert lowered[0][0] == converter.Binding('&kp', (converter.Binding('A'),))